@@ -9,10 +9,16 @@
 #ifndef IPC_DEFS_H
 #define IPC_DEFS_H
 
+#include <limits.h>
+#include <linux/futex.h>
 #include <stdint.h>
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <sys/syscall.h>
 #include <sys/types.h>
+#include <time.h>
+#include <unistd.h>
 
 #ifdef __cplusplus
 extern "C" {
@@ -38,14 +44,42 @@ extern "C" {
 #define IPC_SHM_NAME        "/ipc_shm"
 #define IPC_MUTEX_NAME      "/ipc_mutex"
 #define IPC_SERVER_SEM_NAME "/ipc_server_notify"
-#define IPC_SLOT_SEM_PREFIX "/ipc_slot_"
 
 /**
- * @brief Build the named semaphore path for a slot index.
+ * @brief Build an IPC object name: `base` plus the IPC_NAME_SUFFIX env value.
+ *
+ * The suffix gives concurrent test runs disjoint IPC namespaces (e.g.
+ * one per pytest-xdist worker). With the variable unset the historical
+ * names are produced unchanged.
+ */
+static inline void ipc_object_name(const char *base, char *buf, size_t buflen)
+{
+    const char *suffix = getenv("IPC_NAME_SUFFIX");
+    snprintf(buf, buflen, "%s%s", base, suffix ? suffix : "");
+}
+
+/* --- Futex helpers for the per-slot completion words --- */
+
+/**
+ * @brief Block until a shared futex word changes away from `expected`.
+ *
+ * Uses the non-PRIVATE futex ops because the word lives in /dev/shm and
+ * is shared between unrelated processes. `timeout` is relative and may
+ * be NULL to wait forever. Returns the raw syscall result (0 on wake,
+ * -1 with errno set on EAGAIN/EINTR/ETIMEDOUT).
  */
-static inline void ipc_slot_sem_name(int index, char *buf, size_t buflen)
+static inline long ipc_futex_wait(uint32_t *addr, uint32_t expected,
+                                  const struct timespec *timeout)
 {
-    snprintf(buf, buflen, "%s%d", IPC_SLOT_SEM_PREFIX, index);
+    return syscall(SYS_futex, addr, FUTEX_WAIT, expected, timeout, NULL, 0);
+}
+
+/**
+ * @brief Wake all processes blocked in ipc_futex_wait() on this word.
+ */
+static inline long ipc_futex_wake(uint32_t *addr)
+{
+    return syscall(SYS_futex, addr, FUTEX_WAKE, INT_MAX, NULL, NULL, 0);
 }
 
 /**
@@ -87,14 +121,40 @@ typedef enum {
 
 /**
  * @brief State of a message slot in shared memory.
+ *
+ * IPC_SLOT_CLAIMED is a transient submit-side state: a client CASes
+ * FREE -> CLAIMED to own the slot lock-free, fills in the payload, then
+ * publishes REQUEST_PENDING with a release store.
  */
 typedef enum {
     IPC_SLOT_FREE = 0,
     IPC_SLOT_REQUEST_PENDING,
     IPC_SLOT_PROCESSING,
-    IPC_SLOT_RESPONSE_READY
+    IPC_SLOT_RESPONSE_READY,
+    IPC_SLOT_CLAIMED
 } ipc_slot_state_t;
 
+/**
+ * @brief Atomically transition a slot state from `expected` to `desired`.
+ *
+ * Slot claims and dispatcher hand-offs race lock-free between processes,
+ * so every state transition on the claim path must go through this CAS.
+ * Returns non-zero when the transition was made.
+ */
+static inline int ipc_slot_state_cas(void *state, int expected, int desired)
+{
+    return __atomic_compare_exchange_n((int *)state, &expected, desired, 0,
+                                       __ATOMIC_ACQ_REL, __ATOMIC_RELAXED);
+}
+
+/**
+ * @brief Publish a slot state with release semantics.
+ */
+static inline void ipc_slot_state_store(void *state, int value)
+{
+    __atomic_store_n((int *)state, value, __ATOMIC_RELEASE);
+}
+
 /**
  * @brief Arguments for math operations (32-bit signed integers).
  */
@@ -149,11 +209,23 @@ typedef struct {
 
 /**
  * @brief Layout of the entire shared memory region.
+ *
+ * slot_done[i] is a futex word: the submitter resets it to 0 when
+ * claiming slot i and the server stores 1 (release) + FUTEX_WAKE when
+ * the response is ready. Blocking callers wait on it instead of a
+ * per-slot named semaphore.
+ *
+ * completion_seq is a global futex word the server increments (and
+ * wakes) on every completed request, so clients polling many request
+ * IDs can block until *any* of them may have finished (ipc_wait_any)
+ * instead of sleeping a fixed interval between scans.
  */
 typedef struct {
     uint64_t    server_generation;
     uint64_t    next_request_id;
     MessageSlot slots[IPC_MAX_SLOTS];
+    uint32_t    slot_done[IPC_MAX_SLOTS];
+    uint32_t    completion_seq;
 } SharedMemoryLayout;
 
 #ifdef __cplusplus
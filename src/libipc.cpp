@@ -1,386 +1,568 @@
-/**
- * @file libipc.cpp
- * @brief Implementation of the IPC communication library (libipc.so).
- */
-#include "libipc.h"
-
-#include <cerrno>
-#include <cstdio>
-#include <cstring>
-#include <fcntl.h>
-#include <semaphore.h>
-#include <sys/mman.h>
-#include <sys/stat.h>
-#include <time.h>
-#include <unistd.h>
-
-/* --- Internal state (per-process) --- */
-
-static SharedMemoryLayout *g_shm = nullptr;
-static sem_t *g_mutex_sem = nullptr;
-static sem_t *g_server_sem = nullptr;
-static sem_t *g_slot_sems[IPC_MAX_SLOTS] = {};
-static int    g_shm_fd = -1;
-static uint64_t g_known_generation = 0;
-
-/* --- Helper: build slot semaphore name --- */
-
-static int sem_wait_with_timeout(sem_t *sem, int timeout_sec)
-{
-    while (true) {
-        timespec ts{};
-        if (clock_gettime(CLOCK_REALTIME, &ts) != 0)
-            return -1;
-        ts.tv_sec += timeout_sec;
-
-        if (sem_timedwait(sem, &ts) == 0)
-            return 0;
-        if (errno == EINTR)
-            continue;
-        return -1;
-    }
-}
-
-static bool shm_object_replaced()
-{
-    if (g_shm_fd < 0)
-        return false;
-
-    int live_fd = shm_open(IPC_SHM_NAME, O_RDWR, 0666);
-    if (live_fd < 0)
-        return false;
-
-    struct stat cur{};
-    struct stat live{};
-    bool replaced = false;
-    if (fstat(g_shm_fd, &cur) == 0 && fstat(live_fd, &live) == 0) {
-        replaced = (cur.st_dev != live.st_dev) || (cur.st_ino != live.st_ino);
-    }
-    close(live_fd);
-    return replaced;
-}
-
-static int reconnect_after_server_restart()
-{
-    ipc_cleanup();
-    if (ipc_init() == 0)
-        return IPC_ERR_SERVER_RESTARTED;
-    return -1;
-}
-
-static int ensure_fresh_connection()
-{
-    if (!g_shm)
-        return -1;
-
-    if (shm_object_replaced())
-        return reconnect_after_server_restart();
-
-    if (g_shm->server_generation != g_known_generation)
-        return reconnect_after_server_restart();
-
-    return 0;
-}
-
-static int lock_shared_mutex_with_recovery()
-{
-    static constexpr int kMaxMutexTimeoutRetries = 5;
-    int retries = 0;
-    while (retries < kMaxMutexTimeoutRetries) {
-        if (sem_wait_with_timeout(g_mutex_sem, 1) == 0)
-            return 0;
-        if (errno == ETIMEDOUT) {
-            int rc = ensure_fresh_connection();
-            if (rc != 0)
-                return rc;
-            ++retries;
-            continue;
-        }
-        return -1;
-    }
-    // Prevent indefinite hangs if semaphore stays stale/blocked.
-    return reconnect_after_server_restart();
-}
-
-/* --- Public API (extern "C") --- */
-
-extern "C" int ipc_init(void)
-{
-    g_shm_fd = shm_open(IPC_SHM_NAME, O_RDWR, 0666);
-    if (g_shm_fd < 0) {
-        perror("ipc_init: shm_open");
-        return -1;
-    }
-
-    g_shm = static_cast<SharedMemoryLayout *>(
-        mmap(nullptr, sizeof(SharedMemoryLayout),
-             PROT_READ | PROT_WRITE, MAP_SHARED, g_shm_fd, 0));
-    if (g_shm == MAP_FAILED) {
-        perror("ipc_init: mmap");
-        close(g_shm_fd);
-        g_shm_fd = -1;
-        g_shm = nullptr;
-        return -1;
-    }
-
-    g_mutex_sem = sem_open(IPC_MUTEX_NAME, 0);
-    if (g_mutex_sem == SEM_FAILED) {
-        perror("ipc_init: sem_open mutex");
-        goto fail;
-    }
-
-    g_server_sem = sem_open(IPC_SERVER_SEM_NAME, 0);
-    if (g_server_sem == SEM_FAILED) {
-        perror("ipc_init: sem_open server_notify");
-        goto fail;
-    }
-
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        char name[64];
-        ipc_slot_sem_name(i, name, sizeof(name));
-        g_slot_sems[i] = sem_open(name, 0);
-        if (g_slot_sems[i] == SEM_FAILED) {
-            perror("ipc_init: sem_open slot");
-            goto fail;
-        }
-    }
-
-    g_known_generation = g_shm->server_generation;
-    return 0;
-
-fail:
-    ipc_cleanup();
-    return -1;
-}
-
-extern "C" void ipc_cleanup(void)
-{
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        if (g_slot_sems[i] && g_slot_sems[i] != SEM_FAILED) {
-            sem_close(g_slot_sems[i]);
-            g_slot_sems[i] = nullptr;
-        }
-    }
-    if (g_server_sem && g_server_sem != SEM_FAILED) {
-        sem_close(g_server_sem);
-        g_server_sem = nullptr;
-    }
-    if (g_mutex_sem && g_mutex_sem != SEM_FAILED) {
-        sem_close(g_mutex_sem);
-        g_mutex_sem = nullptr;
-    }
-    if (g_shm && g_shm != MAP_FAILED) {
-        munmap(g_shm, sizeof(SharedMemoryLayout));
-        g_shm = nullptr;
-    }
-    if (g_shm_fd >= 0) {
-        close(g_shm_fd);
-        g_shm_fd = -1;
-    }
-    g_known_generation = 0;
-}
-
-/* --- Internal helpers --- */
-
-static int find_free_slot(void)
-{
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        if (g_shm->slots[i].state == IPC_SLOT_FREE)
-            return i;
-    }
-    return -1;
-}
-
-static int submit_request(ipc_cmd_t cmd, const RequestPayload *payload,
-                          int *out_slot, uint64_t *out_id)
-{
-    int rc = ensure_fresh_connection();
-    if (rc != 0)
-        return rc;
-
-    rc = lock_shared_mutex_with_recovery();
-    if (rc != 0)
-        return rc;
-
-    if (g_shm->server_generation != g_known_generation) {
-        sem_post(g_mutex_sem);
-        return reconnect_after_server_restart();
-    }
-
-    int idx = find_free_slot();
-    if (idx < 0) {
-        sem_post(g_mutex_sem);
-        fprintf(stderr, "submit_request: no free slots\n");
-        return -1;
-    }
-
-    MessageSlot *slot = &g_shm->slots[idx];
-    slot->request_id = g_shm->next_request_id++;
-    slot->client_pid = getpid();
-    slot->command    = cmd;
-    slot->request    = *payload;
-    slot->state      = IPC_SLOT_REQUEST_PENDING;
-
-    if (out_slot) *out_slot = idx;
-    if (out_id)   *out_id = slot->request_id;
-
-    sem_post(g_mutex_sem);
-    sem_post(g_server_sem);
-    return 0;
-}
-
-/* --- Blocking calls --- */
-
-static int blocking_math(ipc_cmd_t cmd, int32_t a, int32_t b, int32_t *result)
-{
-    if (!result) return -1;
-
-    RequestPayload payload;
-    payload.math.a = a;
-    payload.math.b = b;
-
-    int slot_idx = -1;
-    uint64_t expected_request_id = 0;
-    int submit_rc = submit_request(cmd, &payload, &slot_idx, &expected_request_id);
-    if (submit_rc != 0)
-        return submit_rc;
-    // Blocking calls are completed via per-slot semaphores. Validate that the slot
-    // truly contains this request's response to guard against stale semaphore wakeups.
-    static constexpr int kMaxSlotWaitTimeoutRetries = 16;
-    int retries = 0;
-    while (retries < kMaxSlotWaitTimeoutRetries) {
-        if (sem_wait_with_timeout(g_slot_sems[slot_idx], 1) == 0) {
-            int rc = lock_shared_mutex_with_recovery();
-            if (rc != 0)
-                return rc;
-
-            MessageSlot *slot = &g_shm->slots[slot_idx];
-            if (slot->request_id == expected_request_id &&
-                slot->state == IPC_SLOT_RESPONSE_READY) {
-                *result = slot->response.math_result;
-                int ret = (slot->status == IPC_STATUS_OK) ? 0 : -1;
-                slot->state = IPC_SLOT_FREE;
-                sem_post(g_mutex_sem);
-                return ret;
-            }
-
-            sem_post(g_mutex_sem);
-            ++retries;
-            continue;
-        }
-        if (errno == ETIMEDOUT) {
-            int rc = ensure_fresh_connection();
-            if (rc != 0)
-                return rc;
-            ++retries;
-            continue;
-        }
-        return -1;
-    }
-    if (retries >= kMaxSlotWaitTimeoutRetries)
-        return reconnect_after_server_restart();
-    return -1;
-}
-
-extern "C" int ipc_add(int32_t a, int32_t b, int32_t *result)
-{
-    return blocking_math(IPC_CMD_ADD, a, b, result);
-}
-
-extern "C" int ipc_subtract(int32_t a, int32_t b, int32_t *result)
-{
-    return blocking_math(IPC_CMD_SUB, a, b, result);
-}
-
-/* --- Non-blocking calls --- */
-
-static int async_math(ipc_cmd_t cmd, int32_t a, int32_t b,
-                      uint64_t *request_id)
-{
-    if (!request_id) return -1;
-
-    RequestPayload payload;
-    payload.math.a = a;
-    payload.math.b = b;
-
-    return submit_request(cmd, &payload, nullptr, request_id);
-}
-
-static int async_string(ipc_cmd_t cmd, const char *s1, const char *s2,
-                        uint64_t *request_id)
-{
-    if (!request_id) return -1;
-    if (ipc_validate_string(s1) != 0 || ipc_validate_string(s2) != 0) {
-        fprintf(stderr, "async_string: invalid string length "
-                "(must be 1..%d chars)\n", IPC_MAX_STRING_LEN);
-        return -1;
-    }
-
-    RequestPayload payload;
-    memset(&payload, 0, sizeof(payload));
-    strncpy(payload.str.s1, s1, IPC_MAX_STRING_LEN);
-    payload.str.s1[IPC_MAX_STRING_LEN] = '\0';
-    strncpy(payload.str.s2, s2, IPC_MAX_STRING_LEN);
-    payload.str.s2[IPC_MAX_STRING_LEN] = '\0';
-
-    return submit_request(cmd, &payload, nullptr, request_id);
-}
-
-extern "C" int ipc_multiply(int32_t a, int32_t b, uint64_t *request_id)
-{
-    return async_math(IPC_CMD_MUL, a, b, request_id);
-}
-
-extern "C" int ipc_divide(int32_t a, int32_t b, uint64_t *request_id)
-{
-    return async_math(IPC_CMD_DIV, a, b, request_id);
-}
-
-extern "C" int ipc_concat(const char *s1, const char *s2,
-                           uint64_t *request_id)
-{
-    return async_string(IPC_CMD_CONCAT, s1, s2, request_id);
-}
-
-extern "C" int ipc_search(const char *haystack, const char *needle,
-                           uint64_t *request_id)
-{
-    return async_string(IPC_CMD_SEARCH, haystack, needle, request_id);
-}
-
-extern "C" int ipc_get_result(uint64_t request_id, ResponsePayload *result,
-                               ipc_status_t *status)
-{
-    if (!result || !status) return -1;
-
-    int rc = ensure_fresh_connection();
-    if (rc != 0)
-        return rc;
-
-    rc = lock_shared_mutex_with_recovery();
-    if (rc != 0)
-        return rc;
-
-    if (g_shm->server_generation != g_known_generation) {
-        sem_post(g_mutex_sem);
-        return reconnect_after_server_restart();
-    }
-
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        MessageSlot *slot = &g_shm->slots[i];
-        if (slot->request_id == request_id) {
-            if (slot->state == IPC_SLOT_RESPONSE_READY) {
-                *result = slot->response;
-                *status = slot->status;
-                slot->state = IPC_SLOT_FREE;
-                sem_post(g_mutex_sem);
-                return 0;
-            }
-            sem_post(g_mutex_sem);
-            return IPC_NOT_READY;
-        }
-    }
-
-    sem_post(g_mutex_sem);
-    return -1;
-}
+/**
+ * @file libipc.cpp
+ * @brief Implementation of the IPC communication library (libipc.so).
+ */
+#include "libipc.h"
+
+#include <cerrno>
+#include <cstdio>
+#include <cstring>
+#include <fcntl.h>
+#include <semaphore.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+
+/* --- Internal state (per-process) --- */
+
+static SharedMemoryLayout *g_shm = nullptr;
+static sem_t *g_mutex_sem = nullptr;
+static sem_t *g_server_sem = nullptr;
+static int    g_shm_fd = -1;
+static uint64_t g_known_generation = 0;
+
+/* Object names resolved in ipc_init; IPC_NAME_SUFFIX gives concurrent
+ * test runs disjoint IPC namespaces. */
+static char g_shm_name[64];
+static char g_mutex_name[64];
+static char g_notify_name[64];
+
+/* --- Helpers: timed waits --- */
+
+static int sem_wait_with_timeout(sem_t *sem, int timeout_sec)
+{
+    while (true) {
+        timespec ts{};
+        if (clock_gettime(CLOCK_REALTIME, &ts) != 0)
+            return -1;
+        ts.tv_sec += timeout_sec;
+
+        if (sem_timedwait(sem, &ts) == 0)
+            return 0;
+        if (errno == EINTR)
+            continue;
+        return -1;
+    }
+}
+
+/**
+ * Wait until the slot's futex done-word becomes non-zero.
+ *
+ * The uncontended completed case costs no syscall: the acquire load sees
+ * the server's release store and returns immediately. Returns 0 once the
+ * word is set, -1 with errno == ETIMEDOUT on timeout, -1 otherwise.
+ */
+static int futex_wait_done(uint32_t *addr, int timeout_sec)
+{
+    while (__atomic_load_n(addr, __ATOMIC_ACQUIRE) == 0) {
+        timespec ts{};
+        ts.tv_sec = timeout_sec;
+        if (ipc_futex_wait(addr, 0, &ts) == 0)
+            continue; /* woken; re-check the word */
+        if (errno == EAGAIN || errno == EINTR)
+            continue; /* word already changed / interrupted; re-check */
+        return -1;    /* ETIMEDOUT or real error; errno preserved */
+    }
+    return 0;
+}
+
+static bool shm_object_replaced()
+{
+    if (g_shm_fd < 0)
+        return false;
+
+    int live_fd = shm_open(g_shm_name, O_RDWR, 0666);
+    if (live_fd < 0)
+        return false;
+
+    struct stat cur{};
+    struct stat live{};
+    bool replaced = false;
+    if (fstat(g_shm_fd, &cur) == 0 && fstat(live_fd, &live) == 0) {
+        replaced = (cur.st_dev != live.st_dev) || (cur.st_ino != live.st_ino);
+    }
+    close(live_fd);
+    return replaced;
+}
+
+static int reconnect_after_server_restart()
+{
+    ipc_cleanup();
+    if (ipc_init() == 0)
+        return IPC_ERR_SERVER_RESTARTED;
+    return -1;
+}
+
+static int ensure_fresh_connection()
+{
+    if (!g_shm)
+        return -1;
+
+    if (shm_object_replaced())
+        return reconnect_after_server_restart();
+
+    if (g_shm->server_generation != g_known_generation)
+        return reconnect_after_server_restart();
+
+    return 0;
+}
+
+static int lock_shared_mutex_with_recovery()
+{
+    static constexpr int kMaxMutexTimeoutRetries = 5;
+    int retries = 0;
+    while (retries < kMaxMutexTimeoutRetries) {
+        if (sem_wait_with_timeout(g_mutex_sem, 1) == 0)
+            return 0;
+        if (errno == ETIMEDOUT) {
+            int rc = ensure_fresh_connection();
+            if (rc != 0)
+                return rc;
+            ++retries;
+            continue;
+        }
+        return -1;
+    }
+    // Prevent indefinite hangs if semaphore stays stale/blocked.
+    return reconnect_after_server_restart();
+}
+
+/* --- Public API (extern "C") --- */
+
+extern "C" int ipc_init(void)
+{
+    ipc_object_name(IPC_SHM_NAME, g_shm_name, sizeof(g_shm_name));
+    ipc_object_name(IPC_MUTEX_NAME, g_mutex_name, sizeof(g_mutex_name));
+    ipc_object_name(IPC_SERVER_SEM_NAME, g_notify_name, sizeof(g_notify_name));
+
+    g_shm_fd = shm_open(g_shm_name, O_RDWR, 0666);
+    if (g_shm_fd < 0) {
+        perror("ipc_init: shm_open");
+        return -1;
+    }
+
+    g_shm = static_cast<SharedMemoryLayout *>(
+        mmap(nullptr, sizeof(SharedMemoryLayout),
+             PROT_READ | PROT_WRITE, MAP_SHARED, g_shm_fd, 0));
+    if (g_shm == MAP_FAILED) {
+        perror("ipc_init: mmap");
+        close(g_shm_fd);
+        g_shm_fd = -1;
+        g_shm = nullptr;
+        return -1;
+    }
+
+    g_mutex_sem = sem_open(g_mutex_name, 0);
+    if (g_mutex_sem == SEM_FAILED) {
+        perror("ipc_init: sem_open mutex");
+        goto fail;
+    }
+
+    g_server_sem = sem_open(g_notify_name, 0);
+    if (g_server_sem == SEM_FAILED) {
+        perror("ipc_init: sem_open server_notify");
+        goto fail;
+    }
+
+    g_known_generation = g_shm->server_generation;
+    return 0;
+
+fail:
+    ipc_cleanup();
+    return -1;
+}
+
+extern "C" void ipc_cleanup(void)
+{
+    if (g_server_sem && g_server_sem != SEM_FAILED) {
+        sem_close(g_server_sem);
+        g_server_sem = nullptr;
+    }
+    if (g_mutex_sem && g_mutex_sem != SEM_FAILED) {
+        sem_close(g_mutex_sem);
+        g_mutex_sem = nullptr;
+    }
+    if (g_shm && g_shm != MAP_FAILED) {
+        munmap(g_shm, sizeof(SharedMemoryLayout));
+        g_shm = nullptr;
+    }
+    if (g_shm_fd >= 0) {
+        close(g_shm_fd);
+        g_shm_fd = -1;
+    }
+    g_known_generation = 0;
+}
+
+/* --- Internal helpers --- */
+
+static int find_and_claim_free_slot(void)
+{
+    /* Rotate the scan start across calls so concurrent submitters spread
+     * over the table instead of all hammering (and CAS-failing on) slot 0
+     * first. The counter is process-local and only a hint; fairness across
+     * processes still comes from the CAS itself. */
+    static unsigned g_scan_hint = 0;
+    unsigned start = __atomic_fetch_add(&g_scan_hint, 1, __ATOMIC_RELAXED);
+    for (int n = 0; n < IPC_MAX_SLOTS; ++n) {
+        int i = (int)((start + (unsigned)n) % IPC_MAX_SLOTS);
+        if (ipc_slot_state_cas(&g_shm->slots[i].state,
+                               IPC_SLOT_FREE, IPC_SLOT_CLAIMED))
+            return i;
+    }
+    return -1;
+}
+
+/* Core submit step; the caller has already validated the connection.
+ * Split out so batch submitters pay ensure_fresh_connection() once. */
+static int submit_one(ipc_cmd_t cmd, const RequestPayload *payload,
+                      int *out_slot, uint64_t *out_id)
+{
+    /* Lock-free submit: the CAS claim makes the slot ours exclusively, so
+     * the payload can be filled without holding the shared mutex. The
+     * request only becomes visible to the dispatcher with the release
+     * store of REQUEST_PENDING below. */
+    int idx = find_and_claim_free_slot();
+    if (idx < 0) {
+        fprintf(stderr, "submit_request: no free slots\n");
+        return -1;
+    }
+
+    MessageSlot *slot = &g_shm->slots[idx];
+    /* Re-arm the completion futex word before the request is visible. */
+    __atomic_store_n(&g_shm->slot_done[idx], 0, __ATOMIC_RELAXED);
+    slot->request_id = __atomic_fetch_add(&g_shm->next_request_id, 1,
+                                          __ATOMIC_RELAXED);
+    slot->client_pid = getpid();
+    slot->command    = cmd;
+    slot->request    = *payload;
+
+    if (out_slot) *out_slot = idx;
+    if (out_id)   *out_id = slot->request_id;
+
+    ipc_slot_state_store(&slot->state, IPC_SLOT_REQUEST_PENDING);
+    sem_post(g_server_sem);
+    return 0;
+}
+
+static int submit_request(ipc_cmd_t cmd, const RequestPayload *payload,
+                          int *out_slot, uint64_t *out_id)
+{
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    return submit_one(cmd, payload, out_slot, out_id);
+}
+
+/* --- Blocking calls --- */
+
+static int blocking_math(ipc_cmd_t cmd, int32_t a, int32_t b, int32_t *result)
+{
+    if (!result) return -1;
+
+    RequestPayload payload;
+    payload.math.a = a;
+    payload.math.b = b;
+
+    int slot_idx = -1;
+    uint64_t expected_request_id = 0;
+    int submit_rc = submit_request(cmd, &payload, &slot_idx, &expected_request_id);
+    if (submit_rc != 0)
+        return submit_rc;
+    // Blocking calls are completed via the slot's futex done-word. Validate that
+    // the slot truly contains this request's response to guard against stale wakeups.
+    static constexpr int kMaxSlotWaitTimeoutRetries = 16;
+    int retries = 0;
+    while (retries < kMaxSlotWaitTimeoutRetries) {
+        if (futex_wait_done(&g_shm->slot_done[slot_idx], 1) == 0) {
+            int rc = lock_shared_mutex_with_recovery();
+            if (rc != 0)
+                return rc;
+
+            MessageSlot *slot = &g_shm->slots[slot_idx];
+            if (slot->request_id == expected_request_id &&
+                slot->state == IPC_SLOT_RESPONSE_READY) {
+                *result = slot->response.math_result;
+                int ret = (slot->status == IPC_STATUS_OK) ? 0 : -1;
+                ipc_slot_state_store(&slot->state, IPC_SLOT_FREE);
+                sem_post(g_mutex_sem);
+                return ret;
+            }
+
+            sem_post(g_mutex_sem);
+            ++retries;
+            continue;
+        }
+        if (errno == ETIMEDOUT) {
+            int rc = ensure_fresh_connection();
+            if (rc != 0)
+                return rc;
+            ++retries;
+            continue;
+        }
+        return -1;
+    }
+    if (retries >= kMaxSlotWaitTimeoutRetries)
+        return reconnect_after_server_restart();
+    return -1;
+}
+
+extern "C" int ipc_add(int32_t a, int32_t b, int32_t *result)
+{
+    return blocking_math(IPC_CMD_ADD, a, b, result);
+}
+
+extern "C" int ipc_subtract(int32_t a, int32_t b, int32_t *result)
+{
+    return blocking_math(IPC_CMD_SUB, a, b, result);
+}
+
+/* --- Non-blocking calls --- */
+
+static int async_math(ipc_cmd_t cmd, int32_t a, int32_t b,
+                      uint64_t *request_id)
+{
+    if (!request_id) return -1;
+
+    RequestPayload payload;
+    payload.math.a = a;
+    payload.math.b = b;
+
+    return submit_request(cmd, &payload, nullptr, request_id);
+}
+
+static int async_string(ipc_cmd_t cmd, const char *s1, const char *s2,
+                        uint64_t *request_id)
+{
+    if (!request_id) return -1;
+    if (ipc_validate_string(s1) != 0 || ipc_validate_string(s2) != 0) {
+        fprintf(stderr, "async_string: invalid string length "
+                "(must be 1..%d chars)\n", IPC_MAX_STRING_LEN);
+        return -1;
+    }
+
+    RequestPayload payload;
+    memset(&payload, 0, sizeof(payload));
+    strncpy(payload.str.s1, s1, IPC_MAX_STRING_LEN);
+    payload.str.s1[IPC_MAX_STRING_LEN] = '\0';
+    strncpy(payload.str.s2, s2, IPC_MAX_STRING_LEN);
+    payload.str.s2[IPC_MAX_STRING_LEN] = '\0';
+
+    return submit_request(cmd, &payload, nullptr, request_id);
+}
+
+extern "C" int ipc_multiply(int32_t a, int32_t b, uint64_t *request_id)
+{
+    return async_math(IPC_CMD_MUL, a, b, request_id);
+}
+
+extern "C" int ipc_divide(int32_t a, int32_t b, uint64_t *request_id)
+{
+    return async_math(IPC_CMD_DIV, a, b, request_id);
+}
+
+extern "C" int ipc_divide_batch(const int32_t *a, const int32_t *b,
+                                uint64_t *request_ids, size_t n)
+{
+    if (!a || !b || !request_ids) return -1;
+
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    /* One FFI-visible call and one connection check for the whole wave;
+     * each element still claims its slot lock-free. Stops at the first
+     * full-table failure and reports how many requests went out. */
+    size_t submitted = 0;
+    for (; submitted < n; ++submitted) {
+        RequestPayload payload;
+        payload.math.a = a[submitted];
+        payload.math.b = b[submitted];
+        if (submit_one(IPC_CMD_DIV, &payload, nullptr,
+                       &request_ids[submitted]) != 0)
+            break;
+    }
+    return (int)submitted;
+}
+
+extern "C" int ipc_concat(const char *s1, const char *s2,
+                           uint64_t *request_id)
+{
+    return async_string(IPC_CMD_CONCAT, s1, s2, request_id);
+}
+
+extern "C" int ipc_search(const char *haystack, const char *needle,
+                           uint64_t *request_id)
+{
+    return async_string(IPC_CMD_SEARCH, haystack, needle, request_id);
+}
+
+extern "C" int ipc_get_result(uint64_t request_id, ResponsePayload *result,
+                               ipc_status_t *status)
+{
+    if (!result || !status) return -1;
+
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    rc = lock_shared_mutex_with_recovery();
+    if (rc != 0)
+        return rc;
+
+    if (g_shm->server_generation != g_known_generation) {
+        sem_post(g_mutex_sem);
+        return reconnect_after_server_restart();
+    }
+
+    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+        MessageSlot *slot = &g_shm->slots[i];
+        if (slot->request_id == request_id) {
+            if (slot->state == IPC_SLOT_RESPONSE_READY) {
+                *result = slot->response;
+                *status = slot->status;
+                ipc_slot_state_store(&slot->state, IPC_SLOT_FREE);
+                sem_post(g_mutex_sem);
+                return 0;
+            }
+            sem_post(g_mutex_sem);
+            return IPC_NOT_READY;
+        }
+    }
+
+    sem_post(g_mutex_sem);
+    return -1;
+}
+
+extern "C" int ipc_get_result_timed(uint64_t request_id, ResponsePayload *result,
+                                    ipc_status_t *status, int timeout_ms)
+{
+    if (!result || !status) return -1;
+
+    timespec now{};
+    if (clock_gettime(CLOCK_MONOTONIC, &now) != 0)
+        return -1;
+    int64_t deadline_ms = static_cast<int64_t>(now.tv_sec) * 1000 +
+                          now.tv_nsec / 1000000 + timeout_ms;
+
+    for (;;) {
+        int rc = ipc_get_result(request_id, result, status);
+        if (rc != IPC_NOT_READY)
+            return rc;
+
+        /* Locate the slot so the wait can block on its done-word. */
+        int idx = -1;
+        rc = lock_shared_mutex_with_recovery();
+        if (rc != 0)
+            return rc;
+        for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+            if (g_shm->slots[i].request_id == request_id) {
+                idx = i;
+                break;
+            }
+        }
+        sem_post(g_mutex_sem);
+        if (idx < 0)
+            return -1;
+
+        if (clock_gettime(CLOCK_MONOTONIC, &now) != 0)
+            return -1;
+        int64_t remaining_ms = deadline_ms -
+                               (static_cast<int64_t>(now.tv_sec) * 1000 +
+                                now.tv_nsec / 1000000);
+        if (remaining_ms <= 0)
+            return IPC_NOT_READY;
+
+        timespec ts{};
+        ts.tv_sec = remaining_ms / 1000;
+        ts.tv_nsec = (remaining_ms % 1000) * 1000000;
+        if (__atomic_load_n(&g_shm->slot_done[idx], __ATOMIC_ACQUIRE) == 0)
+            ipc_futex_wait(&g_shm->slot_done[idx], 0, &ts);
+        /* Re-collect on wakeup; spurious wakeups and slot reuse are
+         * handled by looping back to ipc_get_result. */
+    }
+}
+
+extern "C" int ipc_wait_any(int timeout_ms)
+{
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    uint32_t seen = __atomic_load_n(&g_shm->completion_seq, __ATOMIC_ACQUIRE);
+    timespec ts{};
+    ts.tv_sec = timeout_ms / 1000;
+    ts.tv_nsec = (timeout_ms % 1000) * 1000000;
+    /* A completion between the caller's last poll and the load above is
+     * not observable here, so the word may already be past `seen`; the
+     * bounded timeout caps that race at one wait interval. */
+    if (__atomic_load_n(&g_shm->completion_seq, __ATOMIC_ACQUIRE) == seen)
+        ipc_futex_wait(&g_shm->completion_seq, seen, timeout_ms >= 0 ? &ts : NULL);
+    return __atomic_load_n(&g_shm->completion_seq, __ATOMIC_ACQUIRE) != seen
+               ? 0 : IPC_NOT_READY;
+}
+
+extern "C" int ipc_get_result_ptr(uint64_t request_id, void **out_ptr,
+                                  size_t *out_len, int *status)
+{
+    if (!out_ptr || !out_len || !status) return -1;
+
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    rc = lock_shared_mutex_with_recovery();
+    if (rc != 0)
+        return rc;
+
+    if (g_shm->server_generation != g_known_generation) {
+        sem_post(g_mutex_sem);
+        return reconnect_after_server_restart();
+    }
+
+    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+        MessageSlot *slot = &g_shm->slots[i];
+        if (slot->request_id == request_id) {
+            if (slot->state == IPC_SLOT_RESPONSE_READY) {
+                /* The slot stays RESPONSE_READY (submitters only claim
+                 * FREE slots), so the response bytes are stable until
+                 * ipc_release_result(). */
+                *out_ptr = &slot->response;
+                *out_len = sizeof(slot->response);
+                *status  = slot->status;
+                sem_post(g_mutex_sem);
+                return 0;
+            }
+            sem_post(g_mutex_sem);
+            return IPC_NOT_READY;
+        }
+    }
+
+    sem_post(g_mutex_sem);
+    return -1;
+}
+
+extern "C" int ipc_release_result(uint64_t request_id)
+{
+    int rc = ensure_fresh_connection();
+    if (rc != 0)
+        return rc;
+
+    rc = lock_shared_mutex_with_recovery();
+    if (rc != 0)
+        return rc;
+
+    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+        MessageSlot *slot = &g_shm->slots[i];
+        if (slot->request_id == request_id &&
+            slot->state == IPC_SLOT_RESPONSE_READY) {
+            ipc_slot_state_store(&slot->state, IPC_SLOT_FREE);
+            sem_post(g_mutex_sem);
+            return 0;
+        }
+    }
+
+    sem_post(g_mutex_sem);
+    return -1;
+}
@@ -96,6 +96,25 @@ int ipc_multiply(int32_t a, int32_t b, uint64_t *request_id);
  */
 int ipc_divide(int32_t a, int32_t b, uint64_t *request_id);
 
+/**
+ * @brief Submit a batch of divisions (non-blocking).
+ *
+ * Equivalent to n ipc_divide() calls but with a single connection
+ * check, so waves of requests cross the API boundary once. Request IDs
+ * are written to request_ids[0..n-1] in submission order; results are
+ * collected per ID exactly as for ipc_divide().
+ *
+ * @param[in]  a            Array of n dividends.
+ * @param[in]  b            Array of n divisors.
+ * @param[out] request_ids  Receives the n assigned request IDs.
+ * @param[in]  n            Number of divisions to submit.
+ * @return The number of requests submitted (< n when the slot table
+ *         fills up), or IPC_ERR_SERVER_RESTARTED / -1 before any
+ *         submission on connection errors.
+ */
+int ipc_divide_batch(const int32_t *a, const int32_t *b,
+                     uint64_t *request_ids, size_t n);
+
 /**
  * @brief Concatenate two strings (non-blocking).
  *
@@ -137,6 +156,73 @@ int ipc_search(const char *haystack, const char *needle, uint64_t *request_id);
 int ipc_get_result(uint64_t request_id, ResponsePayload *result,
                    ipc_status_t *status);
 
+/**
+ * @brief Wait for the result of a non-blocking call with a timeout.
+ *
+ * Like ipc_get_result(), but instead of returning IPC_NOT_READY
+ * immediately it blocks on the slot's completion futex word until the
+ * response is ready or timeout_ms milliseconds have elapsed.
+ *
+ * @param[in]  request_id  The request ID returned by the async call.
+ * @param[out] result      Pointer to store the response payload.
+ * @param[out] status      Pointer to store the response status code.
+ * @param[in]  timeout_ms  Maximum time to wait, in milliseconds.
+ * @return 0 if result is ready, IPC_NOT_READY on timeout,
+ *         IPC_ERR_SERVER_RESTARTED if the server restarted and old request IDs
+ *         were invalidated, -1 on other errors.
+ */
+int ipc_get_result_timed(uint64_t request_id, ResponsePayload *result,
+                         ipc_status_t *status, int timeout_ms);
+
+/**
+ * @brief Block until any request completes, or timeout_ms elapses.
+ *
+ * Waits on a global completion counter the server bumps for every
+ * finished request. Intended for callers polling several request IDs:
+ * scan with ipc_get_result(), then call this instead of sleeping a
+ * fixed interval before the next scan. A completion that lands between
+ * the caller's scan and this call may be missed, so timeout_ms should
+ * stay modest (it bounds the worst case exactly like the sleep did).
+ *
+ * @param[in] timeout_ms  Maximum time to wait, in milliseconds
+ *                        (negative waits indefinitely).
+ * @return 0 if at least one request completed during the wait,
+ *         IPC_NOT_READY on timeout, IPC_ERR_SERVER_RESTARTED if the
+ *         server restarted, -1 on other errors.
+ */
+int ipc_wait_any(int timeout_ms);
+
+/**
+ * @brief Zero-copy variant of ipc_get_result().
+ *
+ * On success, *out_ptr points directly at the response payload inside
+ * shared memory -- no copy is made. The slot stays reserved (and the
+ * pointed-to bytes stay valid) until the caller hands it back with
+ * ipc_release_result(). Callers that want the copy semantics of
+ * ipc_get_result() should keep using that function.
+ *
+ * @param[in]  request_id  The request ID returned by the async call.
+ * @param[out] out_ptr     Receives a pointer into shared memory.
+ * @param[out] out_len     Receives the payload size in bytes.
+ * @param[out] status      Pointer to store the response status code.
+ * @return 0 if result is ready, IPC_NOT_READY if still processing,
+ *         IPC_ERR_SERVER_RESTARTED if the server restarted and old request IDs
+ *         were invalidated, -1 on other errors.
+ */
+int ipc_get_result_ptr(uint64_t request_id, void **out_ptr,
+                       size_t *out_len, int *status);
+
+/**
+ * @brief Release a slot held open by ipc_get_result_ptr().
+ *
+ * Marks the slot FREE so it can carry new requests. The pointer obtained
+ * from ipc_get_result_ptr() must not be dereferenced afterwards.
+ *
+ * @param[in] request_id  The request ID whose result slot to release.
+ * @return 0 on success, -1 if no ready slot holds this request ID.
+ */
+int ipc_release_result(uint64_t request_id);
+
 #ifdef __cplusplus
 }
 #endif
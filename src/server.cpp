@@ -1,544 +1,756 @@
-/**
- * @file server.cpp
- * @brief IPC server: creates shared memory, dispatches requests to thread pools.
- */
-#include "ipc_defs.h"
-
-#include <atomic>
-#include <cerrno>
-#include <condition_variable>
-#include <csignal>
-#include <cstdio>
-#include <cstdlib>
-#include <cstring>
-#include <fcntl.h>
-#include <functional>
-#include <mutex>
-#include <queue>
-#include <semaphore.h>
-#include <sys/file.h>
-#include <sys/mman.h>
-#include <sys/stat.h>
-#include <thread>
-#include <time.h>
-#include <unistd.h>
-#include <vector>
-
-/* ================================================================== */
-/*  ShutdownMode                                                       */
-/* ================================================================== */
-
-enum class ShutdownMode { Drain, Immediate };
-
-/* ================================================================== */
-/*  ThreadPool -- simplified C++17 pool based on CPP11_ThreadPool      */
-/* ================================================================== */
-
-class ThreadPool {
-public:
-    ThreadPool(size_t num_threads, std::function<void(int)> handler)
-        : task_handler_(std::move(handler))
-    {
-        workers_.reserve(num_threads);
-        for (size_t i = 0; i < num_threads; ++i) {
-            workers_.emplace_back([this] {
-                while (true) {
-                    int slot_index;
-                    {
-                        std::unique_lock lock(mutex_);
-                        cv_.wait(lock, [this] {
-                            return stop_.load() || !queue_.empty();
-                        });
-                        if (stop_.load() && queue_.empty())
-                            return;
-                        slot_index = queue_.front();
-                        queue_.pop();
-                    }
-                    task_handler_(slot_index);
-                }
-            });
-        }
-    }
-
-    ~ThreadPool() { shutdown(); }
-
-    bool submit(int slot_index)
-    {
-        {
-            std::scoped_lock lock(mutex_);
-            if (stop_.load())
-                return false;
-            queue_.push(slot_index);
-        }
-        cv_.notify_one();
-        return true;
-    }
-
-    size_t shutdown(ShutdownMode mode = ShutdownMode::Drain)
-    {
-        size_t discarded = 0;
-        if (stop_.exchange(true))
-            return 0;
-        if (mode == ShutdownMode::Immediate) {
-            std::scoped_lock lock(mutex_);
-            discarded = queue_.size();
-            std::queue<int> empty;
-            queue_.swap(empty);
-        }
-        cv_.notify_all();
-        for (auto &w : workers_) {
-            if (w.joinable())
-                w.join();
-        }
-        return discarded;
-    }
-
-    size_t pending_count() const
-    {
-        std::scoped_lock lock(mutex_);
-        return queue_.size();
-    }
-
-private:
-    std::vector<std::thread>     workers_;
-    std::queue<int>              queue_;
-    mutable std::mutex           mutex_;
-    std::condition_variable      cv_;
-    std::atomic<bool>            stop_{false};
-    std::function<void(int)>     task_handler_;
-};
-
-/* ================================================================== */
-/*  Global state                                                       */
-/* ================================================================== */
-
-static const char *LOCK_FILE = "/tmp/ipc_server.lock";
-static const char *GENERATION_FILE = "/tmp/ipc_server.generation";
-
-static std::atomic<bool> g_running{true};
-static std::atomic<bool> g_status_requested{false};
-static ShutdownMode g_shutdown_mode = ShutdownMode::Drain;
-static int g_lock_fd = -1;
-static SharedMemoryLayout *g_shm = nullptr;
-static int g_shm_fd = -1;
-static sem_t *g_mutex_sem = nullptr;
-static sem_t *g_server_sem = nullptr;
-static sem_t *g_slot_sems[IPC_MAX_SLOTS] = {};
-
-static uint64_t next_server_generation()
-{
-    int fd = open(GENERATION_FILE, O_CREAT | O_RDWR, 0666);
-    if (fd < 0) {
-        return static_cast<uint64_t>(time(nullptr));
-    }
-
-    if (flock(fd, LOCK_EX) < 0) {
-        close(fd);
-        return static_cast<uint64_t>(time(nullptr));
-    }
-
-    uint64_t gen = 0;
-    ssize_t n = read(fd, &gen, sizeof(gen));
-    if (n != static_cast<ssize_t>(sizeof(gen))) {
-        gen = 0;
-    }
-    ++gen;
-
-    lseek(fd, 0, SEEK_SET);
-    ssize_t written = write(fd, &gen, sizeof(gen));
-    if (written == static_cast<ssize_t>(sizeof(gen))) {
-        ftruncate(fd, sizeof(gen));
-    }
-
-    flock(fd, LOCK_UN);
-    close(fd);
-    return gen;
-}
-
-static size_t default_threads_per_pool()
-{
-    unsigned hw = std::thread::hardware_concurrency();
-    if (hw <= 2)
-        return 1;
-    return (hw - 1) / 2;
-}
-
-/* ================================================================== */
-/*  Signal handler                                                     */
-/* ================================================================== */
-
-static void signal_handler(int /*sig*/)
-{
-    g_running.store(false);
-    if (g_server_sem)
-        sem_post(g_server_sem);
-}
-
-static void status_handler(int /*sig*/)
-{
-    g_status_requested.store(true);
-    if (g_server_sem)
-        sem_post(g_server_sem);
-}
-
-/* ================================================================== */
-/*  Worker functions                                                   */
-/* ================================================================== */
-
-static void process_math(int slot_idx)
-{
-    sem_wait(g_mutex_sem);
-    MessageSlot *slot = &g_shm->slots[slot_idx];
-    ipc_cmd_t cmd = slot->command;
-    int32_t a = slot->request.math.a;
-    int32_t b = slot->request.math.b;
-    sem_post(g_mutex_sem);
-
-    if (cmd == IPC_CMD_MUL || cmd == IPC_CMD_DIV)
-        std::this_thread::sleep_for(std::chrono::milliseconds(2));
-
-    int32_t result = 0;
-    ipc_status_t status = IPC_STATUS_OK;
-
-    switch (cmd) {
-    case IPC_CMD_ADD: result = a + b; break;
-    case IPC_CMD_SUB: result = a - b; break;
-    case IPC_CMD_MUL: result = a * b; break;
-    case IPC_CMD_DIV:
-        if (b == 0) {
-            status = IPC_STATUS_DIV_BY_ZERO;
-        } else {
-            result = a / b;
-        }
-        break;
-    default:
-        status = IPC_STATUS_INVALID_INPUT;
-        break;
-    }
-
-    sem_wait(g_mutex_sem);
-    slot->response.math_result = result;
-    slot->status = status;
-    slot->state = IPC_SLOT_RESPONSE_READY;
-    sem_post(g_mutex_sem);
-
-    if (cmd == IPC_CMD_ADD || cmd == IPC_CMD_SUB)
-        sem_post(g_slot_sems[slot_idx]);
-}
-
-static void process_string(int slot_idx)
-{
-    sem_wait(g_mutex_sem);
-    MessageSlot *slot = &g_shm->slots[slot_idx];
-    ipc_cmd_t cmd = slot->command;
-    char s1[IPC_MAX_STRING_LEN + 1];
-    char s2[IPC_MAX_STRING_LEN + 1];
-    strncpy(s1, slot->request.str.s1, IPC_MAX_STRING_LEN + 1);
-    strncpy(s2, slot->request.str.s2, IPC_MAX_STRING_LEN + 1);
-    s1[IPC_MAX_STRING_LEN] = '\0';
-    s2[IPC_MAX_STRING_LEN] = '\0';
-    sem_post(g_mutex_sem);
-
-    ipc_status_t status = IPC_STATUS_OK;
-    ResponsePayload resp;
-    memset(&resp, 0, sizeof(resp));
-
-    size_t len1 = strlen(s1);
-    size_t len2 = strlen(s2);
-    if (ipc_validate_string(s1) != 0 || ipc_validate_string(s2) != 0) {
-        status = IPC_STATUS_STR_TOO_LONG;
-    } else if (cmd == IPC_CMD_CONCAT) {
-        if (len1 + len2 > IPC_MAX_RESULT_LEN - 1) {
-            status = IPC_STATUS_STR_TOO_LONG;
-        } else {
-            snprintf(resp.str_result, IPC_MAX_RESULT_LEN, "%s%s", s1, s2);
-        }
-    } else if (cmd == IPC_CMD_SEARCH) {
-        const char *pos = strstr(s1, s2);
-        if (pos) {
-            resp.position = static_cast<int32_t>(pos - s1);
-        } else {
-            resp.position = -1;
-            status = IPC_STATUS_NOT_FOUND;
-        }
-    } else {
-        status = IPC_STATUS_INVALID_INPUT;
-    }
-
-    sem_wait(g_mutex_sem);
-    slot->response = resp;
-    slot->status = status;
-    slot->state = IPC_SLOT_RESPONSE_READY;
-    sem_post(g_mutex_sem);
-
-    // String operations are async-only in this project and are collected via polling.
-}
-
-/* ================================================================== */
-/*  Cleanup                                                            */
-/* ================================================================== */
-
-static void cleanup_ipc(void)
-{
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        if (g_slot_sems[i] && g_slot_sems[i] != SEM_FAILED) {
-            sem_close(g_slot_sems[i]);
-            char name[64];
-            ipc_slot_sem_name(i, name, sizeof(name));
-            sem_unlink(name);
-        }
-    }
-    if (g_server_sem && g_server_sem != SEM_FAILED) {
-        sem_close(g_server_sem);
-        sem_unlink(IPC_SERVER_SEM_NAME);
-    }
-    if (g_mutex_sem && g_mutex_sem != SEM_FAILED) {
-        sem_close(g_mutex_sem);
-        sem_unlink(IPC_MUTEX_NAME);
-    }
-    if (g_shm && g_shm != MAP_FAILED) {
-        munmap(g_shm, sizeof(SharedMemoryLayout));
-    }
-    if (g_shm_fd >= 0) {
-        close(g_shm_fd);
-    }
-    shm_unlink(IPC_SHM_NAME);
-    if (g_lock_fd >= 0) {
-        unlink(LOCK_FILE);
-        close(g_lock_fd);
-    }
-}
-
-/* ================================================================== */
-/*  Main                                                               */
-/* ================================================================== */
-
-int main(int argc, const char *argv[])
-{
-    /* --- Parse command-line flags --- */
-    size_t threads_per_pool = default_threads_per_pool();
-    for (int i = 1; i < argc; ++i) {
-        if (strcmp(argv[i], "-t") == 0 && i + 1 < argc) {
-            int val = atoi(argv[++i]);
-            if (val > 0)
-                threads_per_pool = static_cast<size_t>(val);
-        } else if (strncmp(argv[i], "--shutdown=", 11) == 0) {
-            const char *mode = argv[i] + 11;
-            if (strcmp(mode, "immediate") == 0)
-                g_shutdown_mode = ShutdownMode::Immediate;
-            else if (strcmp(mode, "drain") == 0)
-                g_shutdown_mode = ShutdownMode::Drain;
-            else {
-                fprintf(stderr, "Unknown shutdown mode: %s (use drain or immediate)\n", mode);
-                return 1;
-            }
-        }
-    }
-
-    /* --- Acquire instance lock --- */
-    g_lock_fd = open(LOCK_FILE, O_CREAT | O_RDWR, 0666);
-    if (g_lock_fd < 0) {
-        perror("server: open lock file");
-        return 1;
-    }
-    if (flock(g_lock_fd, LOCK_EX | LOCK_NB) < 0) {
-        if (errno == EWOULDBLOCK) {
-            fprintf(stderr,
-                    "Error: another server instance is already running.\n"
-                    "If the previous server crashed, remove %s and retry.\n",
-                    LOCK_FILE);
-        } else {
-            perror("server: flock");
-        }
-        close(g_lock_fd);
-        return 1;
-    }
-
-    /* --- Create shared memory --- */
-    g_shm_fd = shm_open(IPC_SHM_NAME, O_CREAT | O_RDWR, 0666);
-    if (g_shm_fd < 0) {
-        perror("server: shm_open");
-        return 1;
-    }
-    if (ftruncate(g_shm_fd, sizeof(SharedMemoryLayout)) < 0) {
-        perror("server: ftruncate");
-        close(g_shm_fd);
-        shm_unlink(IPC_SHM_NAME);
-        return 1;
-    }
-    g_shm = static_cast<SharedMemoryLayout *>(
-        mmap(nullptr, sizeof(SharedMemoryLayout),
-             PROT_READ | PROT_WRITE, MAP_SHARED, g_shm_fd, 0));
-    if (g_shm == MAP_FAILED) {
-        perror("server: mmap");
-        close(g_shm_fd);
-        shm_unlink(IPC_SHM_NAME);
-        return 1;
-    }
-
-    uint64_t server_generation = next_server_generation();
-    memset(g_shm, 0, sizeof(SharedMemoryLayout));
-    g_shm->server_generation = server_generation;
-    g_shm->next_request_id = 1;
-
-    /* --- Create semaphores --- */
-    g_mutex_sem = sem_open(IPC_MUTEX_NAME, O_CREAT | O_EXCL, 0666, 1);
-    if (g_mutex_sem == SEM_FAILED) {
-        if (errno == EEXIST) {
-            sem_unlink(IPC_MUTEX_NAME);
-            g_mutex_sem = sem_open(IPC_MUTEX_NAME, O_CREAT | O_EXCL, 0666, 1);
-        }
-        if (g_mutex_sem == SEM_FAILED) {
-            perror("server: sem_open mutex");
-            cleanup_ipc();
-            return 1;
-        }
-    }
-
-    g_server_sem = sem_open(IPC_SERVER_SEM_NAME, O_CREAT | O_EXCL, 0666, 0);
-    if (g_server_sem == SEM_FAILED) {
-        if (errno == EEXIST) {
-            sem_unlink(IPC_SERVER_SEM_NAME);
-            g_server_sem = sem_open(IPC_SERVER_SEM_NAME, O_CREAT | O_EXCL, 0666, 0);
-        }
-        if (g_server_sem == SEM_FAILED) {
-            perror("server: sem_open server_notify");
-            cleanup_ipc();
-            return 1;
-        }
-    }
-
-    for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-        char name[64];
-        ipc_slot_sem_name(i, name, sizeof(name));
-        g_slot_sems[i] = sem_open(name, O_CREAT | O_EXCL, 0666, 0);
-        if (g_slot_sems[i] == SEM_FAILED) {
-            if (errno == EEXIST) {
-                sem_unlink(name);
-                g_slot_sems[i] = sem_open(name, O_CREAT | O_EXCL, 0666, 0);
-            }
-            if (g_slot_sems[i] == SEM_FAILED) {
-                perror("server: sem_open slot");
-                cleanup_ipc();
-                return 1;
-            }
-        }
-    }
-
-    /* --- Signal handling --- */
-    struct sigaction sa;
-    memset(&sa, 0, sizeof(sa));
-    sa.sa_handler = signal_handler;
-    sigemptyset(&sa.sa_mask);
-    sa.sa_flags = 0;
-    sigaction(SIGINT, &sa, nullptr);
-    sigaction(SIGTERM, &sa, nullptr);
-
-    struct sigaction sa_status;
-    memset(&sa_status, 0, sizeof(sa_status));
-    sa_status.sa_handler = status_handler;
-    sigemptyset(&sa_status.sa_mask);
-    sa_status.sa_flags = 0;
-    sigaction(SIGUSR1, &sa_status, nullptr);
-
-    time_t start_time = time(nullptr);
-
-    /* --- Thread pools --- */
-    ThreadPool math_pool(threads_per_pool, process_math);
-    ThreadPool string_pool(threads_per_pool, process_string);
-
-    printf("Server started. PID=%d, generation=%llu, cores=%u, threads/pool=%zu, shutdown=%s. "
-           "Waiting for requests...\n",
-           getpid(), static_cast<unsigned long long>(server_generation),
-           std::thread::hardware_concurrency(), threads_per_pool,
-           (g_shutdown_mode == ShutdownMode::Drain) ? "drain" : "immediate");
-    fflush(stdout);
-
-    /* --- Dispatcher loop --- */
-    while (g_running.load()) {
-        sem_wait(g_server_sem);
-
-        if (g_status_requested.exchange(false)) {
-            time_t now = time(nullptr);
-            long uptime = static_cast<long>(difftime(now, start_time));
-            long hours = uptime / 3600;
-            long mins  = (uptime % 3600) / 60;
-            long secs  = uptime % 60;
-            const char *mode_str = (g_shutdown_mode == ShutdownMode::Drain)
-                                       ? "drain" : "immediate";
-
-            int free_slots = 0, pending_slots = 0, proc_slots = 0, ready_slots = 0;
-            sem_wait(g_mutex_sem);
-            for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-                switch (g_shm->slots[i].state) {
-                case IPC_SLOT_FREE:           ++free_slots;    break;
-                case IPC_SLOT_REQUEST_PENDING: ++pending_slots; break;
-                case IPC_SLOT_PROCESSING:      ++proc_slots;    break;
-                case IPC_SLOT_RESPONSE_READY:  ++ready_slots;   break;
-                }
-            }
-            sem_post(g_mutex_sem);
-
-            printf("[STATUS] PID=%d, uptime=%ldh%02ldm%02lds, mode=%s, "
-                   "threads/pool=%zu\n",
-                   getpid(), hours, mins, secs, mode_str, threads_per_pool);
-            printf("[STATUS] math_pool: %zu pending, string_pool: %zu pending\n",
-                   math_pool.pending_count(), string_pool.pending_count());
-            printf("[STATUS] slots: %d free, %d pending, %d processing, %d ready\n",
-                   free_slots, pending_slots, proc_slots, ready_slots);
-            fflush(stdout);
-        }
-
-        if (!g_running.load())
-            break;
-
-        sem_wait(g_mutex_sem);
-        for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
-            if (g_shm->slots[i].state == IPC_SLOT_REQUEST_PENDING) {
-                g_shm->slots[i].state = IPC_SLOT_PROCESSING;
-                ipc_cmd_t cmd = g_shm->slots[i].command;
-
-                sem_post(g_mutex_sem);
-
-                switch (cmd) {
-                case IPC_CMD_ADD:
-                case IPC_CMD_SUB:
-                case IPC_CMD_MUL:
-                case IPC_CMD_DIV:
-                    math_pool.submit(i);
-                    break;
-                case IPC_CMD_CONCAT:
-                case IPC_CMD_SEARCH:
-                    string_pool.submit(i);
-                    break;
-                }
-
-                sem_wait(g_mutex_sem);
-            }
-        }
-        sem_post(g_mutex_sem);
-    }
-
-    /* --- Shutdown --- */
-    size_t pending = math_pool.pending_count() + string_pool.pending_count();
-
-    if (g_shutdown_mode == ShutdownMode::Drain) {
-        printf("\nShutdown requested (drain mode). "
-               "%zu pending task(s) will be finished before exit.\n", pending);
-    } else {
-        printf("\nShutdown requested (immediate mode). "
-               "Discarding pending task(s).\n");
-    }
-    fflush(stdout);
-
-    size_t discarded_math   = math_pool.shutdown(g_shutdown_mode);
-    size_t discarded_string = string_pool.shutdown(g_shutdown_mode);
-    if (g_shutdown_mode == ShutdownMode::Immediate && (discarded_math + discarded_string) > 0) {
-        printf("Discarded %zu task(s).\n", discarded_math + discarded_string);
-    }
-
-    cleanup_ipc();
-    printf("Server shut down cleanly.\n");
-
-    return 0;
-}
+/**
+ * @file server.cpp
+ * @brief IPC server: creates shared memory, dispatches requests to thread pools.
+ */
+#include "ipc_defs.h"
+
+#include <atomic>
+#include <cerrno>
+#include <condition_variable>
+#include <csignal>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <fcntl.h>
+#include <functional>
+#include <mutex>
+#include <pthread.h>
+#include <queue>
+#include <sched.h>
+#include <semaphore.h>
+#include <string>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <thread>
+#include <time.h>
+#include <unistd.h>
+#include <vector>
+
+/* ================================================================== */
+/*  ShutdownMode                                                       */
+/* ================================================================== */
+
+enum class ShutdownMode { Drain, Immediate };
+
+/* ================================================================== */
+/*  ThreadPool -- simplified C++17 pool based on CPP11_ThreadPool      */
+/* ================================================================== */
+
+class ThreadPool {
+public:
+    ThreadPool(size_t num_threads, std::function<void(int)> handler,
+               const std::vector<int> &pin_cpus = {})
+        : task_handler_(std::move(handler))
+    {
+        workers_.reserve(num_threads);
+        for (size_t i = 0; i < num_threads; ++i) {
+            workers_.emplace_back([this] {
+                while (true) {
+                    int slot_index;
+                    {
+                        std::unique_lock lock(mutex_);
+                        cv_.wait(lock, [this] {
+                            return stop_.load() || !queue_.empty();
+                        });
+                        if (stop_.load() && queue_.empty())
+                            return;
+                        slot_index = queue_.front();
+                        queue_.pop();
+                    }
+                    active_.fetch_add(1, std::memory_order_relaxed);
+                    task_handler_(slot_index);
+                    active_.fetch_sub(1, std::memory_order_relaxed);
+                }
+            });
+            if (!pin_cpus.empty()) {
+                /* Round-robin pin over the allowed CPUs so workers keep
+                 * their cache-warm slot data instead of migrating.
+                 * Best-effort: a failed pin just leaves the thread floating. */
+                cpu_set_t one;
+                CPU_ZERO(&one);
+                CPU_SET(pin_cpus[i % pin_cpus.size()], &one);
+                pthread_setaffinity_np(workers_.back().native_handle(),
+                                       sizeof(one), &one);
+            }
+        }
+    }
+
+    ~ThreadPool() { shutdown(); }
+
+    bool submit(int slot_index)
+    {
+        {
+            std::scoped_lock lock(mutex_);
+            if (stop_.load())
+                return false;
+            queue_.push(slot_index);
+        }
+        cv_.notify_one();
+        return true;
+    }
+
+    size_t shutdown(ShutdownMode mode = ShutdownMode::Drain)
+    {
+        size_t discarded = 0;
+        if (stop_.exchange(true))
+            return 0;
+        if (mode == ShutdownMode::Immediate) {
+            std::scoped_lock lock(mutex_);
+            discarded = queue_.size();
+            std::queue<int> empty;
+            queue_.swap(empty);
+        }
+        cv_.notify_all();
+        for (auto &w : workers_) {
+            if (w.joinable())
+                w.join();
+        }
+        return discarded;
+    }
+
+    size_t pending_count() const
+    {
+        std::scoped_lock lock(mutex_);
+        return queue_.size();
+    }
+
+    /** Workers currently executing a task (the rest are parked in cv_.wait). */
+    size_t active_count() const
+    {
+        return active_.load(std::memory_order_relaxed);
+    }
+
+private:
+    std::vector<std::thread>     workers_;
+    std::queue<int>              queue_;
+    mutable std::mutex           mutex_;
+    std::condition_variable      cv_;
+    std::atomic<bool>            stop_{false};
+    std::atomic<size_t>          active_{0};
+    std::function<void(int)>     task_handler_;
+};
+
+/* ================================================================== */
+/*  Global state                                                       */
+/* ================================================================== */
+
+/* Object names and paths resolved at startup; the IPC_NAME_SUFFIX env
+ * variable gives concurrent test runs disjoint IPC namespaces. */
+static char g_lock_file[128];
+static char g_generation_file[128];
+static char g_shm_name[64];
+static char g_mutex_name[64];
+static char g_notify_name[64];
+
+static void init_ipc_names()
+{
+    const char *suffix = getenv("IPC_NAME_SUFFIX");
+    if (!suffix)
+        suffix = "";
+    snprintf(g_lock_file, sizeof(g_lock_file),
+             "/tmp/ipc_server%s.lock", suffix);
+    snprintf(g_generation_file, sizeof(g_generation_file),
+             "/tmp/ipc_server%s.generation", suffix);
+    ipc_object_name(IPC_SHM_NAME, g_shm_name, sizeof(g_shm_name));
+    ipc_object_name(IPC_MUTEX_NAME, g_mutex_name, sizeof(g_mutex_name));
+    ipc_object_name(IPC_SERVER_SEM_NAME, g_notify_name, sizeof(g_notify_name));
+}
+
+static std::atomic<bool> g_running{true};
+static std::atomic<bool> g_status_requested{false};
+static ShutdownMode g_shutdown_mode = ShutdownMode::Drain;
+static int g_lock_fd = -1;
+static SharedMemoryLayout *g_shm = nullptr;
+static int g_shm_fd = -1;
+static sem_t *g_mutex_sem = nullptr;
+static sem_t *g_server_sem = nullptr;
+
+static uint64_t next_server_generation()
+{
+    int fd = open(g_generation_file, O_CREAT | O_RDWR, 0666);
+    if (fd < 0) {
+        return static_cast<uint64_t>(time(nullptr));
+    }
+
+    if (flock(fd, LOCK_EX) < 0) {
+        close(fd);
+        return static_cast<uint64_t>(time(nullptr));
+    }
+
+    uint64_t gen = 0;
+    ssize_t n = read(fd, &gen, sizeof(gen));
+    if (n != static_cast<ssize_t>(sizeof(gen))) {
+        gen = 0;
+    }
+    ++gen;
+
+    lseek(fd, 0, SEEK_SET);
+    ssize_t written = write(fd, &gen, sizeof(gen));
+    if (written == static_cast<ssize_t>(sizeof(gen))) {
+        ftruncate(fd, sizeof(gen));
+    }
+
+    flock(fd, LOCK_UN);
+    close(fd);
+    return gen;
+}
+
+/**
+ * The generation a server started now would report, without persisting
+ * the increment. Used by --dry-run so banner-only runs do not burn
+ * generation numbers (clients detect restarts by generation changes).
+ */
+static uint64_t peek_server_generation()
+{
+    int fd = open(g_generation_file, O_RDONLY);
+    if (fd < 0) {
+        return static_cast<uint64_t>(time(nullptr));
+    }
+
+    uint64_t gen = 0;
+    if (flock(fd, LOCK_SH) == 0) {
+        ssize_t n = read(fd, &gen, sizeof(gen));
+        if (n != static_cast<ssize_t>(sizeof(gen))) {
+            gen = 0;
+        }
+        flock(fd, LOCK_UN);
+    }
+    close(fd);
+    return gen + 1;
+}
+
+/**
+ * Print the startup banner line shared by normal startup and --dry-run.
+ */
+static void print_startup_banner(uint64_t generation, size_t threads_per_pool,
+                                 const std::vector<int> &pin_cpus)
+{
+    std::string affinity_str;
+    for (int c : pin_cpus) {
+        if (!affinity_str.empty())
+            affinity_str += ',';
+        affinity_str += std::to_string(c);
+    }
+
+    printf("Server started. PID=%d, generation=%llu, cores=%u, threads/pool=%zu, "
+           "affinity=%s, shutdown=%s. Waiting for requests...\n",
+           getpid(), static_cast<unsigned long long>(generation),
+           std::thread::hardware_concurrency(), threads_per_pool,
+           affinity_str.c_str(),
+           (g_shutdown_mode == ShutdownMode::Drain) ? "drain" : "immediate");
+    fflush(stdout);
+}
+
+/**
+ * CPUs this process may run on, per sched_getaffinity. Honoring the
+ * affinity mask (instead of the raw online-CPU count) keeps pinning
+ * correct on cgroup-restricted runners.
+ */
+static std::vector<int> allowed_cpu_list()
+{
+    std::vector<int> cpus;
+    cpu_set_t set;
+    if (sched_getaffinity(0, sizeof(set), &set) == 0) {
+        for (int c = 0; c < CPU_SETSIZE; ++c) {
+            if (CPU_ISSET(c, &set))
+                cpus.push_back(c);
+        }
+    }
+    return cpus;
+}
+
+/**
+ * Parse a comma-separated CPU list ("0,2,4") and intersect it with the
+ * allowed set. Returns an empty vector (and prints to stderr) when no
+ * requested CPU is usable.
+ */
+static std::vector<int> parse_affinity_arg(const char *arg,
+                                           const std::vector<int> &allowed)
+{
+    std::vector<int> cpus;
+    const char *p = arg;
+    while (*p) {
+        char *end = nullptr;
+        long cpu = strtol(p, &end, 10);
+        if (end == p) {
+            fprintf(stderr, "Invalid --affinity list: %s\n", arg);
+            return {};
+        }
+        for (int a : allowed) {
+            if (a == cpu) {
+                cpus.push_back(static_cast<int>(cpu));
+                break;
+            }
+        }
+        p = (*end == ',') ? end + 1 : end;
+    }
+    if (cpus.empty())
+        fprintf(stderr, "No usable CPUs in --affinity list: %s\n", arg);
+    return cpus;
+}
+
+/**
+ * Parallelism actually available to this process: the CPUs in the
+ * affinity mask with SMT siblings folded, so hyperthread pairs count as
+ * one core. Falls back to the mask size (no topology info), then to
+ * hardware_concurrency (no usable mask).
+ */
+static size_t detect_pool_size()
+{
+    std::vector<int> cpus = allowed_cpu_list();
+    if (cpus.empty()) {
+        unsigned hw = std::thread::hardware_concurrency();
+        return hw ? hw : 1;
+    }
+
+    /* Each thread_siblings_list begins with the group's lowest CPU id;
+     * counting distinct leaders counts physical cores. */
+    std::vector<long> leaders;
+    for (int c : cpus) {
+        char path[128];
+        snprintf(path, sizeof(path),
+                 "/sys/devices/system/cpu/cpu%d/topology/thread_siblings_list",
+                 c);
+        long leader = c;
+        FILE *f = fopen(path, "r");
+        if (f) {
+            char buf[64] = {};
+            if (fgets(buf, sizeof(buf), f))
+                leader = strtol(buf, nullptr, 10);
+            fclose(f);
+        }
+        bool seen = false;
+        for (long l : leaders) {
+            if (l == leader) {
+                seen = true;
+                break;
+            }
+        }
+        if (!seen)
+            leaders.push_back(leader);
+    }
+    return leaders.empty() ? cpus.size() : leaders.size();
+}
+
+static size_t default_threads_per_pool()
+{
+    size_t cores = detect_pool_size();
+    if (cores <= 2)
+        return 1;
+    return (cores - 1) / 2;
+}
+
+/* ================================================================== */
+/*  Signal handler                                                     */
+/* ================================================================== */
+
+static void signal_handler(int /*sig*/)
+{
+    g_running.store(false);
+    if (g_server_sem)
+        sem_post(g_server_sem);
+}
+
+static void status_handler(int /*sig*/)
+{
+    g_status_requested.store(true);
+    if (g_server_sem)
+        sem_post(g_server_sem);
+}
+
+/* ================================================================== */
+/*  Worker functions                                                   */
+/* ================================================================== */
+
+static void process_math(int slot_idx)
+{
+    sem_wait(g_mutex_sem);
+    MessageSlot *slot = &g_shm->slots[slot_idx];
+    ipc_cmd_t cmd = slot->command;
+    int32_t a = slot->request.math.a;
+    int32_t b = slot->request.math.b;
+    sem_post(g_mutex_sem);
+
+    if (cmd == IPC_CMD_MUL || cmd == IPC_CMD_DIV)
+        std::this_thread::sleep_for(std::chrono::milliseconds(2));
+
+    int32_t result = 0;
+    ipc_status_t status = IPC_STATUS_OK;
+
+    switch (cmd) {
+    case IPC_CMD_ADD: result = a + b; break;
+    case IPC_CMD_SUB: result = a - b; break;
+    case IPC_CMD_MUL: result = a * b; break;
+    case IPC_CMD_DIV:
+        if (b == 0) {
+            status = IPC_STATUS_DIV_BY_ZERO;
+        } else {
+            result = a / b;
+        }
+        break;
+    default:
+        status = IPC_STATUS_INVALID_INPUT;
+        break;
+    }
+
+    sem_wait(g_mutex_sem);
+    slot->response.math_result = result;
+    slot->status = status;
+    ipc_slot_state_store(&slot->state, IPC_SLOT_RESPONSE_READY);
+    sem_post(g_mutex_sem);
+
+    __atomic_store_n(&g_shm->slot_done[slot_idx], 1, __ATOMIC_RELEASE);
+    ipc_futex_wake(&g_shm->slot_done[slot_idx]);
+    __atomic_fetch_add(&g_shm->completion_seq, 1, __ATOMIC_RELEASE);
+    ipc_futex_wake(&g_shm->completion_seq);
+}
+
+static void process_string(int slot_idx)
+{
+    sem_wait(g_mutex_sem);
+    MessageSlot *slot = &g_shm->slots[slot_idx];
+    ipc_cmd_t cmd = slot->command;
+    char s1[IPC_MAX_STRING_LEN + 1];
+    char s2[IPC_MAX_STRING_LEN + 1];
+    strncpy(s1, slot->request.str.s1, IPC_MAX_STRING_LEN + 1);
+    strncpy(s2, slot->request.str.s2, IPC_MAX_STRING_LEN + 1);
+    s1[IPC_MAX_STRING_LEN] = '\0';
+    s2[IPC_MAX_STRING_LEN] = '\0';
+    sem_post(g_mutex_sem);
+
+    ipc_status_t status = IPC_STATUS_OK;
+    ResponsePayload resp;
+    memset(&resp, 0, sizeof(resp));
+
+    size_t len1 = strlen(s1);
+    size_t len2 = strlen(s2);
+    if (ipc_validate_string(s1) != 0 || ipc_validate_string(s2) != 0) {
+        status = IPC_STATUS_STR_TOO_LONG;
+    } else if (cmd == IPC_CMD_CONCAT) {
+        if (len1 + len2 > IPC_MAX_RESULT_LEN - 1) {
+            status = IPC_STATUS_STR_TOO_LONG;
+        } else {
+            snprintf(resp.str_result, IPC_MAX_RESULT_LEN, "%s%s", s1, s2);
+        }
+    } else if (cmd == IPC_CMD_SEARCH) {
+        const char *pos = strstr(s1, s2);
+        if (pos) {
+            resp.position = static_cast<int32_t>(pos - s1);
+        } else {
+            resp.position = -1;
+            status = IPC_STATUS_NOT_FOUND;
+        }
+    } else {
+        status = IPC_STATUS_INVALID_INPUT;
+    }
+
+    sem_wait(g_mutex_sem);
+    slot->response = resp;
+    slot->status = status;
+    ipc_slot_state_store(&slot->state, IPC_SLOT_RESPONSE_READY);
+    sem_post(g_mutex_sem);
+
+    // String operations are collected via polling, but the done word is
+    // published uniformly so any waiter on this slot wakes immediately.
+    __atomic_store_n(&g_shm->slot_done[slot_idx], 1, __ATOMIC_RELEASE);
+    ipc_futex_wake(&g_shm->slot_done[slot_idx]);
+    __atomic_fetch_add(&g_shm->completion_seq, 1, __ATOMIC_RELEASE);
+    ipc_futex_wake(&g_shm->completion_seq);
+}
+
+/* ================================================================== */
+/*  Cleanup                                                            */
+/* ================================================================== */
+
+static void cleanup_ipc(void)
+{
+    if (g_server_sem && g_server_sem != SEM_FAILED) {
+        sem_close(g_server_sem);
+        sem_unlink(g_notify_name);
+    }
+    if (g_mutex_sem && g_mutex_sem != SEM_FAILED) {
+        sem_close(g_mutex_sem);
+        sem_unlink(g_mutex_name);
+    }
+    if (g_shm && g_shm != MAP_FAILED) {
+        munmap(g_shm, sizeof(SharedMemoryLayout));
+    }
+    if (g_shm_fd >= 0) {
+        close(g_shm_fd);
+    }
+    shm_unlink(g_shm_name);
+    if (g_lock_fd >= 0) {
+        unlink(g_lock_file);
+        close(g_lock_fd);
+    }
+}
+
+/* ================================================================== */
+/*  Main                                                               */
+/* ================================================================== */
+
+int main(int argc, const char *argv[])
+{
+    init_ipc_names();
+
+    /* --- Parse command-line flags --- */
+    size_t threads_per_pool = default_threads_per_pool();
+    const char *affinity_arg = nullptr;
+    bool dry_run = false;
+    for (int i = 1; i < argc; ++i) {
+        const char *arg = argv[i];
+        if (strcmp(arg, "-t") == 0) {
+            if (i + 1 >= argc) {
+                fprintf(stderr, "Option -t requires a thread count\n");
+                return 1;
+            }
+            int val = atoi(argv[++i]);
+            if (val > 0)
+                threads_per_pool = static_cast<size_t>(val);
+        } else if (strncmp(arg, "--shutdown=", 11) == 0) {
+            const char *mode = arg + 11;
+            if (strcmp(mode, "immediate") == 0)
+                g_shutdown_mode = ShutdownMode::Immediate;
+            else if (strcmp(mode, "drain") == 0)
+                g_shutdown_mode = ShutdownMode::Drain;
+            else {
+                fprintf(stderr, "Unknown shutdown mode: %s (use drain or immediate)\n", mode);
+                return 1;
+            }
+        } else if (strncmp(arg, "--affinity=", 11) == 0) {
+            affinity_arg = arg + 11;
+        } else if (strcmp(arg, "--dry-run") == 0) {
+            dry_run = true;
+        } else {
+            /* Fail fast on anything unrecognized instead of silently
+             * ignoring it, so a typo cannot launch a misconfigured
+             * long-running server. */
+            fprintf(stderr,
+                    "Unknown option: %s (use -t N, --shutdown=MODE, "
+                    "--affinity=LIST, --dry-run)\n",
+                    arg);
+            return 1;
+        }
+    }
+
+    std::vector<int> pin_cpus = allowed_cpu_list();
+    if (affinity_arg) {
+        pin_cpus = parse_affinity_arg(affinity_arg, pin_cpus);
+        if (pin_cpus.empty())
+            return 1;
+    }
+
+    if (dry_run) {
+        /* Banner-only mode: report the configuration this invocation
+         * would run with, touching no locks, IPC objects, or threads.
+         * Lets tests that only inspect the banner skip the full
+         * startup/shutdown round-trip. */
+        print_startup_banner(peek_server_generation(), threads_per_pool,
+                             pin_cpus);
+        return 0;
+    }
+
+    /* --- Acquire instance lock --- */
+    g_lock_fd = open(g_lock_file, O_CREAT | O_RDWR, 0666);
+    if (g_lock_fd < 0) {
+        perror("server: open lock file");
+        return 1;
+    }
+    if (flock(g_lock_fd, LOCK_EX | LOCK_NB) < 0) {
+        if (errno == EWOULDBLOCK) {
+            fprintf(stderr,
+                    "Error: another server instance is already running.\n"
+                    "If the previous server crashed, remove %s and retry.\n",
+                    g_lock_file);
+        } else {
+            perror("server: flock");
+        }
+        close(g_lock_fd);
+        return 1;
+    }
+
+    /* --- Create shared memory --- */
+    g_shm_fd = shm_open(g_shm_name, O_CREAT | O_RDWR, 0666);
+    if (g_shm_fd < 0) {
+        perror("server: shm_open");
+        return 1;
+    }
+    if (ftruncate(g_shm_fd, sizeof(SharedMemoryLayout)) < 0) {
+        perror("server: ftruncate");
+        close(g_shm_fd);
+        shm_unlink(g_shm_name);
+        return 1;
+    }
+    g_shm = static_cast<SharedMemoryLayout *>(
+        mmap(nullptr, sizeof(SharedMemoryLayout),
+             PROT_READ | PROT_WRITE, MAP_SHARED, g_shm_fd, 0));
+    if (g_shm == MAP_FAILED) {
+        perror("server: mmap");
+        close(g_shm_fd);
+        shm_unlink(g_shm_name);
+        return 1;
+    }
+
+    uint64_t server_generation = next_server_generation();
+    memset(g_shm, 0, sizeof(SharedMemoryLayout));
+    g_shm->server_generation = server_generation;
+    g_shm->next_request_id = 1;
+
+    /* --- Create semaphores --- */
+    g_mutex_sem = sem_open(g_mutex_name, O_CREAT | O_EXCL, 0666, 1);
+    if (g_mutex_sem == SEM_FAILED) {
+        if (errno == EEXIST) {
+            sem_unlink(g_mutex_name);
+            g_mutex_sem = sem_open(g_mutex_name, O_CREAT | O_EXCL, 0666, 1);
+        }
+        if (g_mutex_sem == SEM_FAILED) {
+            perror("server: sem_open mutex");
+            cleanup_ipc();
+            return 1;
+        }
+    }
+
+    g_server_sem = sem_open(g_notify_name, O_CREAT | O_EXCL, 0666, 0);
+    if (g_server_sem == SEM_FAILED) {
+        if (errno == EEXIST) {
+            sem_unlink(g_notify_name);
+            g_server_sem = sem_open(g_notify_name, O_CREAT | O_EXCL, 0666, 0);
+        }
+        if (g_server_sem == SEM_FAILED) {
+            perror("server: sem_open server_notify");
+            cleanup_ipc();
+            return 1;
+        }
+    }
+
+    /* --- Signal handling --- */
+    struct sigaction sa;
+    memset(&sa, 0, sizeof(sa));
+    sa.sa_handler = signal_handler;
+    sigemptyset(&sa.sa_mask);
+    sa.sa_flags = 0;
+    sigaction(SIGINT, &sa, nullptr);
+    sigaction(SIGTERM, &sa, nullptr);
+
+    struct sigaction sa_status;
+    memset(&sa_status, 0, sizeof(sa_status));
+    sa_status.sa_handler = status_handler;
+    sigemptyset(&sa_status.sa_mask);
+    sa_status.sa_flags = 0;
+    sigaction(SIGUSR1, &sa_status, nullptr);
+
+    time_t start_time = time(nullptr);
+
+    /* --- Thread pools --- */
+    ThreadPool math_pool(threads_per_pool, process_math, pin_cpus);
+    ThreadPool string_pool(threads_per_pool, process_string, pin_cpus);
+
+    print_startup_banner(server_generation, threads_per_pool, pin_cpus);
+
+    /* --- Dispatcher loop --- */
+    while (g_running.load()) {
+        sem_wait(g_server_sem);
+
+        /* Coalesce burst wakeups: the slot scan below handles every
+         * request deposited so far, so extra notify tokens would only
+         * trigger redundant scans. Drain them now, like a single
+         * eventfd counter read. Safe because every wakeup reason
+         * (status flag, shutdown flag, pending slots) is level-checked
+         * below rather than carried by the token itself. */
+        while (sem_trywait(g_server_sem) == 0) {
+        }
+
+        if (g_status_requested.exchange(false)) {
+            time_t now = time(nullptr);
+            long uptime = static_cast<long>(difftime(now, start_time));
+            long hours = uptime / 3600;
+            long mins  = (uptime % 3600) / 60;
+            long secs  = uptime % 60;
+            const char *mode_str = (g_shutdown_mode == ShutdownMode::Drain)
+                                       ? "drain" : "immediate";
+
+            int free_slots = 0, pending_slots = 0, proc_slots = 0, ready_slots = 0;
+            sem_wait(g_mutex_sem);
+            for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+                switch (g_shm->slots[i].state) {
+                case IPC_SLOT_FREE:           ++free_slots;    break;
+                case IPC_SLOT_REQUEST_PENDING: ++pending_slots; break;
+                case IPC_SLOT_PROCESSING:      ++proc_slots;    break;
+                case IPC_SLOT_RESPONSE_READY:  ++ready_slots;   break;
+                case IPC_SLOT_CLAIMED:         ++pending_slots; break;
+                }
+            }
+            sem_post(g_mutex_sem);
+
+            printf("[STATUS] PID=%d, uptime=%ldh%02ldm%02lds, mode=%s, "
+                   "threads/pool=%zu\n",
+                   getpid(), hours, mins, secs, mode_str, threads_per_pool);
+            printf("[STATUS] math_pool: %zu pending, active=%zu, "
+                   "string_pool: %zu pending, active=%zu\n",
+                   math_pool.pending_count(), math_pool.active_count(),
+                   string_pool.pending_count(), string_pool.active_count());
+            printf("[STATUS] slots: %d free, %d pending, %d processing, %d ready\n",
+                   free_slots, pending_slots, proc_slots, ready_slots);
+            fflush(stdout);
+        }
+
+        if (!g_running.load())
+            break;
+
+        /* Edge-triggered style: having drained the notify tokens above,
+         * keep rescanning until a full pass finds no pending slot, so a
+         * request deposited mid-scan is picked up in this wakeup instead
+         * of waiting for the next one. */
+        bool found_pending;
+        do {
+            found_pending = false;
+            for (int i = 0; i < IPC_MAX_SLOTS; ++i) {
+                /* CAS hand-off: the acquire on success orders the payload
+                 * reads after the client's release publish, so no mutex is
+                 * needed on the dispatch path. */
+                if (!ipc_slot_state_cas(&g_shm->slots[i].state,
+                                        IPC_SLOT_REQUEST_PENDING,
+                                        IPC_SLOT_PROCESSING))
+                    continue;
+                found_pending = true;
+
+                switch (g_shm->slots[i].command) {
+                case IPC_CMD_ADD:
+                case IPC_CMD_SUB:
+                case IPC_CMD_MUL:
+                case IPC_CMD_DIV:
+                    math_pool.submit(i);
+                    break;
+                case IPC_CMD_CONCAT:
+                case IPC_CMD_SEARCH:
+                    string_pool.submit(i);
+                    break;
+                }
+            }
+        } while (found_pending && g_running.load());
+    }
+
+    /* --- Shutdown --- */
+    size_t pending = math_pool.pending_count() + string_pool.pending_count();
+
+    if (g_shutdown_mode == ShutdownMode::Drain) {
+        printf("\nShutdown requested (drain mode). "
+               "%zu pending task(s) will be finished before exit.\n", pending);
+    } else {
+        printf("\nShutdown requested (immediate mode). "
+               "Discarding pending task(s).\n");
+    }
+    fflush(stdout);
+
+    size_t discarded_math   = math_pool.shutdown(g_shutdown_mode);
+    size_t discarded_string = string_pool.shutdown(g_shutdown_mode);
+    if (g_shutdown_mode == ShutdownMode::Immediate && (discarded_math + discarded_string) > 0) {
+        printf("Discarded %zu task(s).\n", discarded_math + discarded_string);
+    }
+
+    cleanup_ipc();
+    printf("Server shut down cleanly.\n");
+
+    return 0;
+}
@@ -1,310 +1,769 @@
-"""Pytest fixtures for IPC client-server integration tests."""
-import errno
-import fcntl
-import os
-import signal
-import subprocess
-import time
-from typing import List
-
-import pytest
-
-BUILD_DIR = os.path.join(os.path.dirname(__file__), "..", "build")
-SERVER_BIN = os.path.join(BUILD_DIR, "server")
-SERVER_BIN_REALPATH = os.path.realpath(SERVER_BIN)
-SHM_PATH = "/dev/shm/ipc_shm"
-PYTEST_LOCK_FILE = "/tmp/ipc_pytest.lock"
-
-
-def _pid_is_alive(pid: int) -> bool:
-    try:
-        os.kill(pid, 0)
-    except ProcessLookupError:
-        return False
-    except PermissionError:
-        return True
-    return True
-
-
-def _wait_pids_exit(pids: List[int], timeout_sec: float) -> List[int]:
-    deadline = time.time() + timeout_sec
-    remaining = list(dict.fromkeys(pids))
-    while remaining and time.time() < deadline:
-        remaining = [pid for pid in remaining if _pid_is_alive(pid)]
-        if remaining:
-            time.sleep(0.05)
-    return remaining
-
-
-def list_workspace_server_pids() -> List[int]:
-    """List running PIDs whose executable matches this workspace server binary."""
-    pids = []
-    try:
-        proc_entries = os.listdir("/proc")
-    except Exception:
-        return []
-
-    for name in proc_entries:
-        if not name.isdigit():
-            continue
-        pid = int(name)
-        if pid == os.getpid():
-            continue
-        try:
-            exe_path = os.path.realpath(f"/proc/{pid}/exe")
-        except OSError:
-            continue
-        if exe_path == SERVER_BIN_REALPATH:
-            pids.append(pid)
-
-    return sorted(set(pids))
-
-
-def ensure_no_external_server_running(context: str, allowed_pids=None):
-    """Fail fast if a server process exists outside allowed ownership."""
-    allowed = set(allowed_pids or [])
-    pids = [pid for pid in list_workspace_server_pids() if pid not in allowed]
-    if pids:
-        raise RuntimeError(
-            f"{context}: external server process(es) detected: {pids}. "
-            "Stop manual server instances before running pytest."
-        )
-
-
-def cleanup_orphan_servers():
-    """Terminate orphan server processes from this workspace build path."""
-    pids = list_workspace_server_pids()
-    if not pids:
-        return
-
-    for pid in pids:
-        try:
-            os.kill(pid, signal.SIGTERM)
-        except ProcessLookupError:
-            pass
-
-    remaining = _wait_pids_exit(pids, timeout_sec=1.5)
-    for pid in remaining:
-        try:
-            os.kill(pid, signal.SIGKILL)
-        except ProcessLookupError:
-            pass
-
-    _wait_pids_exit(remaining, timeout_sec=1.0)
-
-
-def acquire_test_run_lock_nonblocking(lock_path: str = PYTEST_LOCK_FILE) -> int:
-    """Acquire a process-wide pytest lock to avoid concurrent IPC test runs."""
-    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o666)
-    try:
-        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-    except OSError as exc:
-        os.close(fd)
-        if exc.errno in (errno.EACCES, errno.EAGAIN):
-            raise RuntimeError(
-                f"Another IPC pytest run is active (lock: {lock_path}). "
-                "Run test suites sequentially."
-            ) from exc
-        raise
-    return fd
-
-
-def release_test_run_lock(fd: int):
-    try:
-        fcntl.flock(fd, fcntl.LOCK_UN)
-    finally:
-        os.close(fd)
-
-
-def try_acquire_lock_for_tests(lock_path: str = PYTEST_LOCK_FILE):
-    """Internal helper used by tests to validate lock contention behavior."""
-    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o666)
-    try:
-        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-    except OSError as exc:
-        os.close(fd)
-        if exc.errno in (errno.EACCES, errno.EAGAIN):
-            return None
-        raise
-    return fd
-
-
-def cleanup_ipc_files():
-    """Remove known IPC objects and lock file."""
-    # Never touch global IPC objects while any server process is still running.
-    if list_workspace_server_pids():
-        return
-    if os.path.exists(SHM_PATH):
-        os.remove(SHM_PATH)
-    for i in range(16):
-        path = f"/dev/shm/sem.ipc_slot_{i}"
-        if os.path.exists(path):
-            os.remove(path)
-    for name in ("sem.ipc_mutex", "sem.ipc_server_notify"):
-        path = f"/dev/shm/{name}"
-        if os.path.exists(path):
-            os.remove(path)
-    # Keep lock file path; flock lock ownership is inode-based and stale path is harmless.
-
-
-def pytest_configure(config):
-    config.addinivalue_line(
-        "markers",
-        "self_managed_server: tests that manage their own server lifecycle",
-    )
-
-
-def pytest_collection_modifyitems(config, items):
-    config._needs_session_server = any(  # type: ignore[attr-defined]
-        "self_managed_server" not in item.keywords for item in items
-    )
-
-
-def pytest_sessionstart(session):
-    """Startup diagnostics and fail-fast guard for external server detection."""
-    pids = list_workspace_server_pids()
-    if os.environ.get("IPC_TEST_DEBUG_PIDS", "1") != "0":
-        print(f"[IPC_TEST_DEBUG] server_bin: {SERVER_BIN}")
-        print(f"[IPC_TEST_DEBUG] server_bin_realpath: {SERVER_BIN_REALPATH}")
-        print(f"[IPC_TEST_DEBUG] detected server pids at session start: {pids}")
-    if pids and os.environ.get("IPC_TEST_ABORT_ON_EXTERNAL", "1") != "0":
-        pytest.exit(
-            "Aborting pytest: external server instance(s) detected at startup: "
-            f"{pids}. Stop manual server processes before running tests.",
-            returncode=2,
-        )
-
-
-@pytest.fixture(scope="session", autouse=True)
-def ipc_test_run_lock():
-    """Ensure only one IPC pytest invocation runs at a time."""
-    fd = acquire_test_run_lock_nonblocking()
-    try:
-        yield
-    finally:
-        release_test_run_lock(fd)
-
-
-@pytest.fixture(scope="session", autouse=True)
-def server_process(request, ipc_test_run_lock):
-    """Start the server before all tests and shut it down after."""
-    # Skip global fixture for suites that self-manage server lifecycle.
-    if not getattr(request.config, "_needs_session_server", True):
-        yield None
-        return
-
-    ensure_no_external_server_running("server_process startup")
-    cleanup_ipc_files()
-
-    proc = subprocess.Popen(
-        [SERVER_BIN, "-t", "2"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        cwd=BUILD_DIR,
-        start_new_session=True,
-    )
-
-    try:
-        # Wait for shared memory to appear (server is ready)
-        for _ in range(50):
-            if os.path.exists(SHM_PATH):
-                break
-            time.sleep(0.1)
-        else:
-            proc.kill()
-            raise RuntimeError("Server did not create shared memory in time")
-
-        # Small extra delay for semaphore initialization
-        time.sleep(0.2)
-
-        yield proc
-    finally:
-        # Graceful shutdown of fixture-owned process only.
-        if proc.poll() is None:
-            try:
-                os.killpg(proc.pid, signal.SIGINT)
-            except ProcessLookupError:
-                pass
-        try:
-            proc.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            if proc.poll() is None:
-                try:
-                    os.killpg(proc.pid, signal.SIGTERM)
-                except ProcessLookupError:
-                    pass
-            try:
-                proc.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                if proc.poll() is None:
-                    try:
-                        os.killpg(proc.pid, signal.SIGKILL)
-                    except ProcessLookupError:
-                        pass
-                proc.wait()
-
-        ensure_no_external_server_running("server_process teardown", allowed_pids={proc.pid})
-        cleanup_ipc_files()
-
-
-def run_client(client_name, inputs, timeout=10):
-    """Run a client binary with scripted stdin and return stdout."""
-    client_bin = os.path.join(BUILD_DIR, client_name)
-    env = os.environ.copy()
-    env["LD_LIBRARY_PATH"] = BUILD_DIR
-
-    proc = subprocess.Popen(
-        [client_bin],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        cwd=BUILD_DIR,
-        env=env,
-    )
-
-    stdin_data = "\n".join(str(i) for i in inputs) + "\n"
-    stdout, stderr = proc.communicate(input=stdin_data.encode(), timeout=timeout)
-    return stdout.decode(), stderr.decode(), proc.returncode
-
-
-def run_client_with_delays(client_name, input_groups, timeout=15):
-    """Run a client with timed input groups for async testing.
-
-    input_groups is a list of (inputs_list, delay_after_seconds) tuples.
-    """
-    client_bin = os.path.join(BUILD_DIR, client_name)
-    env = os.environ.copy()
-    env["LD_LIBRARY_PATH"] = BUILD_DIR
-
-    proc = subprocess.Popen(
-        [client_bin],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        cwd=BUILD_DIR,
-        env=env,
-    )
-
-    for inputs, delay in input_groups:
-        if proc.poll() is not None:
-            break
-        data = "\n".join(str(i) for i in inputs) + "\n"
-        try:
-            proc.stdin.write(data.encode())
-            proc.stdin.flush()
-        except (BrokenPipeError, ValueError):
-            # Client exited early; collect whatever output is available.
-            break
-        if delay > 0:
-            time.sleep(delay)
-
-    # Python 3.13+ may flush stdin inside communicate(); avoid "flush of closed file"
-    # after we intentionally close stdin for interactive client scripts.
-    if proc.stdin is not None:
-        try:
-            proc.stdin.close()
-        except Exception:
-            pass
-        proc.stdin = None
-    stdout, stderr = proc.communicate(timeout=timeout)
-    return stdout.decode(), stderr.decode(), proc.returncode
+"""Pytest fixtures for IPC client-server integration tests."""
+import ctypes
+import os
+import select
+import signal
+import struct
+import subprocess
+import time
+from typing import List
+
+import pytest
+
+# Resolved once at import so the embedded ".." is not re-walked by the
+# kernel on every spawn/stat that uses these paths.
+BUILD_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "build"))
+SERVER_BIN = os.path.join(BUILD_DIR, "server")
+SERVER_BIN_REALPATH = os.path.realpath(SERVER_BIN)
+# comm as it appears in /proc/PID/stat (kernel truncates to 15 chars).
+_SERVER_COMM = os.path.basename(SERVER_BIN).encode()[:15]
+# (st_dev, st_ino) identity of the server binary; comparing inode numbers
+# is cheaper than comparing resolved path strings and survives renames.
+try:
+    _server_st = os.stat(SERVER_BIN)
+    _SERVER_BIN_KEY = (_server_st.st_dev, _server_st.st_ino)
+except OSError:  # binary not built yet; fall back to path comparison
+    _SERVER_BIN_KEY = None
+# Per-run IPC namespace suffix, derived from the pytest-xdist worker id
+# when present so parallel workers use disjoint IPC objects. Exported so
+# every spawned server/client builds the same suffixed names.
+_XDIST_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "")
+IPC_NAME_SUFFIX = os.environ.get(
+    "IPC_NAME_SUFFIX", f"_{_XDIST_WORKER}" if _XDIST_WORKER else ""
+)
+if IPC_NAME_SUFFIX:
+    os.environ["IPC_NAME_SUFFIX"] = IPC_NAME_SUFFIX
+
+SHM_PATH = f"/dev/shm/ipc_shm{IPC_NAME_SUFFIX}"
+PYTEST_LOCK_FILE = f"/tmp/ipc_pytest{IPC_NAME_SUFFIX}.lock"
+# Instance lock the server itself creates (and removes on clean exit).
+SERVER_LOCK_FILE = f"/tmp/ipc_server{IPC_NAME_SUFFIX}.lock"
+
+# /dev/shm directory fd opened once per process: the cleanup sweep scans
+# and unlinks relative to it, so entries resolve with one path walk at
+# import instead of one per call. Held for the process lifetime (the
+# kernel closes it at exit); falls back to absolute paths if /dev/shm
+# cannot be opened.
+try:
+    _DSHM_FD = os.open("/dev/shm", os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+except OSError:
+    _DSHM_FD = None
+
+# IPC object basenames expected in /dev/shm for this namespace.
+_IPC_SHM_OBJECTS = frozenset({
+    f"ipc_shm{IPC_NAME_SUFFIX}",
+    f"sem.ipc_mutex{IPC_NAME_SUFFIX}",
+    f"sem.ipc_server_notify{IPC_NAME_SUFFIX}",
+})
+
+
+# inotify constants/bindings for event-driven file-creation waits.
+_IN_CREATE = 0x00000100
+_IN_MOVED_TO = 0x00000080
+_INOTIFY_EVENT_HDR = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:  # pragma: no cover - no usable libc handle
+    _libc = None
+
+
+def _wait_for_file_creation(directory: str, filename: str, timeout_sec: float) -> bool:
+    """Wait until directory/filename exists, waking on inotify IN_CREATE.
+
+    Falls back to the historical 100ms existence poll when inotify is
+    unavailable. Returns True if the file exists before the timeout.
+    """
+    path = os.path.join(directory, filename)
+    deadline = time.monotonic() + timeout_sec
+
+    ifd = -1
+    if _libc is not None:
+        ifd = _libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    if ifd < 0:
+        # Fallback: timed existence poll.
+        while time.monotonic() < deadline:
+            if os.path.exists(path):
+                return True
+            time.sleep(0.1)
+        return os.path.exists(path)
+
+    try:
+        wd = _libc.inotify_add_watch(
+            ifd, directory.encode(), _IN_CREATE | _IN_MOVED_TO
+        )
+        if wd < 0:
+            while time.monotonic() < deadline:
+                if os.path.exists(path):
+                    return True
+                time.sleep(0.1)
+            return os.path.exists(path)
+
+        # Check once after arming the watch so a file created before the
+        # watch existed is not missed.
+        if os.path.exists(path):
+            return True
+
+        target = filename.encode()
+        poller = select.poll()
+        poller.register(ifd, select.POLLIN)
+        while True:
+            remaining_ms = (deadline - time.monotonic()) * 1000
+            if remaining_ms <= 0:
+                return os.path.exists(path)
+            if not poller.poll(remaining_ms):
+                continue
+            data = os.read(ifd, 4096)
+            offset = 0
+            while offset + _INOTIFY_EVENT_HDR.size <= len(data):
+                _, _, _, name_len = _INOTIFY_EVENT_HDR.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT_HDR.size
+                name = data[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if name == target:
+                    return True
+    finally:
+        os.close(ifd)
+
+
+class _SpawnedProc:
+    """Minimal Popen-like handle for servers launched via os.posix_spawn.
+
+    posix_spawn skips fork's page-table duplication of the (large) pytest
+    process. stdout/stderr land in memfd-backed files rather than pipes,
+    so the server can never block on a full 64KB pipe buffer no matter
+    how much it prints before we drain it; readers pread at explicit
+    offsets. Only the surface the harness actually uses is implemented:
+    poll/wait/communicate/send_signal/kill plus stdout/stderr file
+    objects. The child gets its own process group so os.killpg works.
+    """
+
+    def __init__(self, argv, env=None):
+        self.args = argv
+        self.returncode = None
+        # MFD_CLOEXEC closes the parent-side fds across the exec; the
+        # dup2 copies onto fds 1/2 survive it.
+        out_fd = os.memfd_create("srv_out", os.MFD_CLOEXEC)
+        err_fd = os.memfd_create("srv_err", os.MFD_CLOEXEC)
+        try:
+            self.pid = os.posix_spawn(
+                argv[0],
+                argv,
+                dict(os.environ) if env is None else env,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, out_fd, 1),
+                    (os.POSIX_SPAWN_DUP2, err_fd, 2),
+                ],
+                setpgroup=0,
+            )
+        except OSError:
+            os.close(out_fd)
+            os.close(err_fd)
+            raise
+        self.stdout = os.fdopen(out_fd, "rb")
+        self.stderr = os.fdopen(err_fd, "rb")
+        # Bytes already handed out to streaming readers (_wait_for_output
+        # style); communicate() only returns data past these marks.
+        self._out_read = 0
+        self._err_read = 0
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid == self.pid:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is not None:
+            return self.returncode
+        if timeout is not None:
+            try:
+                pidfd = os.pidfd_open(self.pid)
+            except (AttributeError, OSError):
+                deadline = time.monotonic() + timeout
+                while self.poll() is None:
+                    if time.monotonic() >= deadline:
+                        raise subprocess.TimeoutExpired(self.args, timeout)
+                    time.sleep(0.005)
+                return self.returncode
+            try:
+                poller = select.poll()
+                poller.register(pidfd, select.POLLIN)
+                if not poller.poll(timeout * 1000):
+                    raise subprocess.TimeoutExpired(self.args, timeout)
+            finally:
+                os.close(pidfd)
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def _read_from_mark(self, fd, mark_attr):
+        chunks = []
+        offset = getattr(self, mark_attr)
+        while True:
+            chunk = os.pread(fd, 65536, offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            chunks.append(chunk)
+        setattr(self, mark_attr, offset)
+        return b"".join(chunks)
+
+    def communicate(self, timeout=None):
+        self.wait(timeout)
+        out = self._read_from_mark(self.stdout.fileno(), "_out_read")
+        err = self._read_from_mark(self.stderr.fileno(), "_err_read")
+        return out, err
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+def spawn_server(*args) -> _SpawnedProc:
+    """Launch the server binary via posix_spawn in its own process group."""
+    global _ipc_maybe_dirty
+    _ipc_maybe_dirty = True
+    return _SpawnedProc([SERVER_BIN, *args])
+
+
+def wait_for_ipc_ready(timeout_sec: float = 5.0) -> bool:
+    """Wait until every IPC object the server creates exists in /dev/shm.
+
+    The notify semaphore is created last, so once all objects are
+    visible the server is ready; this replaces the fixed post-shm sleep
+    that used to cover semaphore creation.
+    """
+    deadline = time.monotonic() + timeout_sec
+    for name in sorted(_IPC_SHM_OBJECTS):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if not _wait_for_file_creation("/dev/shm", name, remaining):
+            return False
+    return True
+
+
+def _wait_proc_exit(proc: subprocess.Popen, timeout_sec: float) -> bool:
+    """Wait for a Popen child to exit, waking on pidfd readability.
+
+    subprocess.wait(timeout=...) is a sleep-based polling loop; a pidfd
+    registered with poll() gets a kernel wakeup the moment the child
+    exits. Returns True once the child has been reaped. Falls back to
+    proc.wait when pidfd_open is unavailable.
+    """
+    if proc.poll() is not None:
+        return True
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        try:
+            proc.wait(timeout=timeout_sec)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        if not poller.poll(timeout_sec * 1000):
+            return False
+        # Child has exited; this wait only reaps, it cannot sleep.
+        proc.wait()
+        return True
+    finally:
+        os.close(pidfd)
+
+
+def _shutdown_server_process(proc: subprocess.Popen):
+    """Escalating SIGINT -> SIGTERM -> SIGKILL shutdown of a server child.
+
+    One pidfd is registered with poll() and reused across every
+    escalation step, so exit is detected at the kernel wakeup rather
+    than a wait() poll tick. Falls back to the timed-wait escalation
+    when pidfd_open is unavailable.
+    """
+    if proc.poll() is not None:
+        return
+
+    def _signal_group(sig):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    _signal_group(signal.SIGINT)
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        if not _wait_proc_exit(proc, timeout_sec=5):
+            _signal_group(signal.SIGTERM)
+            if not _wait_proc_exit(proc, timeout_sec=2):
+                _signal_group(signal.SIGKILL)
+                proc.wait()
+        return
+
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        if not poller.poll(5000):
+            _signal_group(signal.SIGTERM)
+            if not poller.poll(2000):
+                _signal_group(signal.SIGKILL)
+                poller.poll(1000)
+    finally:
+        os.close(pidfd)
+    # SIGKILL cannot be ignored, so by now this only reaps.
+    proc.wait()
+
+
+def _pid_is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _wait_pids_exit_pidfd(pids: List[int], deadline: float):
+    """Wait on one pidfd per PID via epoll; returns None if pidfds are unusable."""
+    if not hasattr(os, "pidfd_open"):
+        return None
+
+    fd_to_pid = {}
+    try:
+        try:
+            for pid in pids:
+                try:
+                    fd_to_pid[os.pidfd_open(pid)] = pid
+                except ProcessLookupError:
+                    continue  # exited between the liveness check and here
+        except OSError:
+            return None  # EPERM/ENOSYS etc.; caller falls back to polling
+
+        ep = select.epoll()
+        try:
+            for fd in fd_to_pid:
+                ep.register(fd, select.EPOLLIN)
+            while fd_to_pid:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                for fd, _ in ep.poll(timeout):
+                    ep.unregister(fd)
+                    del fd_to_pid[fd]
+                    os.close(fd)
+            return sorted(fd_to_pid.values())
+        finally:
+            ep.close()
+    finally:
+        for fd in fd_to_pid:
+            os.close(fd)
+
+
+def _wait_pids_exit(pids: List[int], timeout_sec: float) -> List[int]:
+    deadline = time.monotonic() + timeout_sec
+    remaining = [pid for pid in dict.fromkeys(pids) if _pid_is_alive(pid)]
+    if not remaining:
+        return []
+
+    survivors = _wait_pids_exit_pidfd(remaining, deadline)
+    if survivors is not None:
+        return survivors
+
+    # Exponential backoff: fast-exiting children are caught within ~1ms,
+    # long waits settle at the previous 50ms cadence.
+    delay = 0.001
+    while remaining and time.monotonic() < deadline:
+        still_alive = [pid for pid in remaining if _pid_is_alive(pid)]
+        if len(still_alive) < len(remaining):
+            delay = 0.001  # one just exited; others may be about to
+        remaining = still_alive
+        if remaining:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+    return remaining
+
+
+# Result cache for list_workspace_server_pids; collapses the adjacent full
+# /proc scans that happen within one fixture phase.
+_pids_cache = {"t": 0.0, "v": []}
+
+
+def invalidate_server_pids_cache():
+    """Drop the cached /proc scan result (call after killing/reaping servers)."""
+    _pids_cache["t"] = 0.0
+
+
+def list_workspace_server_pids(max_age: float = 0.0) -> List[int]:
+    """List running PIDs whose executable matches this workspace server binary.
+
+    A positive max_age allows reusing a scan result that recent; the
+    default always rescans, which correctness-critical callers (the
+    external-server guards) rely on.
+    """
+    if max_age > 0 and time.monotonic() - _pids_cache["t"] < max_age:
+        return _pids_cache["v"]
+    pids = []
+    my_pid = os.getpid()
+    try:
+        entries = os.scandir("/proc")
+    except OSError:
+        return []
+
+    with entries:
+        for entry in entries:
+            name = entry.name
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            if pid == my_pid:
+                continue
+            # Cheap prefilter: /proc/PID/stat is world-readable and carries
+            # comm in parentheses, so almost every PID is rejected without
+            # the permission-checked readlink below.
+            try:
+                with open(f"/proc/{name}/stat", "rb") as f:
+                    stat_head = f.read(256)
+            except OSError:
+                continue
+            lpar = stat_head.find(b"(")
+            rpar = stat_head.rfind(b")")
+            if lpar < 0 or rpar < lpar or stat_head[lpar + 1:rpar] != _SERVER_COMM:
+                continue
+            try:
+                # stat on /proc/PID/exe follows the link, so comparing
+                # (st_dev, st_ino) against the binary's identity replaces
+                # the readlink + path-string comparison.
+                if _SERVER_BIN_KEY is not None:
+                    st = os.stat(f"/proc/{name}/exe")
+                    if (st.st_dev, st.st_ino) == _SERVER_BIN_KEY:
+                        pids.append(pid)
+                elif os.readlink(f"/proc/{name}/exe") == SERVER_BIN_REALPATH:
+                    pids.append(pid)
+            except OSError:
+                # Dead PID, kernel thread, or other-user process (EACCES).
+                continue
+
+    _pids_cache["v"] = sorted(set(pids))
+    _pids_cache["t"] = time.monotonic()
+    return _pids_cache["v"]
+
+
+def ensure_no_external_server_running(context: str, allowed_pids=None):
+    """Fail fast if a server process exists outside allowed ownership."""
+    allowed = set(allowed_pids or [])
+    pids = [pid for pid in list_workspace_server_pids() if pid not in allowed]
+    if pids:
+        raise RuntimeError(
+            f"{context}: external server process(es) detected: {pids}. "
+            "Stop manual server instances before running pytest."
+        )
+
+
+def cleanup_orphan_servers():
+    """Terminate orphan server processes from this workspace build path."""
+    pids = list_workspace_server_pids()
+    if not pids:
+        return
+
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    remaining = _wait_pids_exit(pids, timeout_sec=1.5)
+    for pid in remaining:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    _wait_pids_exit(remaining, timeout_sec=1.0)
+    invalidate_server_pids_cache()
+
+
+def _read_lock_owner(lock_path: str):
+    """Return the PID recorded in the lock file, or None if unreadable."""
+    try:
+        with open(lock_path, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _try_create_lock(lock_path: str):
+    """One atomic O_CREAT|O_EXCL lock attempt; returns fd or None if held.
+
+    A single exclusive create is atomic on any POSIX filesystem
+    (including NFS, where flock is unreliable). The file records the
+    owner PID so a lock left behind by a crashed run can be reclaimed.
+    """
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            owner = _read_lock_owner(lock_path)
+            if owner is not None and _pid_is_alive(owner):
+                return None
+            # Stale lock from a dead or crashed run; reclaim and retry once.
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        return fd
+    return None
+
+
+def acquire_test_run_lock_nonblocking(lock_path: str = PYTEST_LOCK_FILE) -> int:
+    """Acquire a process-wide pytest lock to avoid concurrent IPC test runs."""
+    fd = _try_create_lock(lock_path)
+    if fd is None:
+        raise RuntimeError(
+            f"Another IPC pytest run is active (lock: {lock_path}). "
+            "Run test suites sequentially."
+        )
+    return fd
+
+
+def release_test_run_lock(fd: int, lock_path: str = PYTEST_LOCK_FILE):
+    try:
+        os.unlink(lock_path)
+    except FileNotFoundError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def try_acquire_lock_for_tests(lock_path: str = PYTEST_LOCK_FILE):
+    """Internal helper used by tests to validate lock contention behavior."""
+    return _try_create_lock(lock_path)
+
+
+# Tests call cleanup back to back (start preflight, then finally block);
+# once a sweep found nothing there is nothing new to remove until another
+# server has been spawned. One lstat confirms the shortcut stays valid
+# even for servers launched outside spawn_server.
+_ipc_maybe_dirty = True
+
+
+def cleanup_ipc_files(allow_force: bool = False):
+    """Remove known IPC objects and lock file.
+
+    allow_force skips the server-liveness guard for callers that have
+    just verified server state themselves (saves one full /proc scan).
+    """
+    global _ipc_maybe_dirty
+    if not _ipc_maybe_dirty and not os.path.lexists(SHM_PATH):
+        return
+    # Never touch global IPC objects while any server process is still running.
+    # A 100ms-old scan is fresh enough for this guard; adjacent fixture steps
+    # reuse it instead of walking /proc again.
+    if not allow_force and list_workspace_server_pids(max_age=0.1):
+        return
+    try:
+        entries = os.scandir("/dev/shm" if _DSHM_FD is None else _DSHM_FD)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            name = entry.name
+            if name in _IPC_SHM_OBJECTS:
+                try:
+                    if _DSHM_FD is None:
+                        os.unlink(entry.path)
+                    else:
+                        os.unlink(name, dir_fd=_DSHM_FD)
+                except FileNotFoundError:
+                    pass
+    _ipc_maybe_dirty = False
+    # Keep lock file path; flock lock ownership is inode-based and stale path is harmless.
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "self_managed_server: tests that manage their own server lifecycle",
+    )
+    # Registered so runs without pytest-xdist do not warn about it. Under
+    # -n, tests spawning real servers share one group (one worker): the
+    # external-server preflight scans /proc for any server binary and
+    # would flag another worker's instance as foreign.
+    config.addinivalue_line(
+        "markers",
+        "xdist_group(name): serialize tests onto one pytest-xdist worker",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    config._needs_session_server = any(  # type: ignore[attr-defined]
+        "self_managed_server" not in item.keywords for item in items
+    )
+
+
+def pytest_sessionstart(session):
+    """Startup diagnostics and fail-fast guard for external server detection."""
+    debug = os.environ.get("IPC_TEST_DEBUG_PIDS", "1") != "0"
+    abort = os.environ.get("IPC_TEST_ABORT_ON_EXTERNAL", "1") != "0"
+    if not debug and not abort:
+        # Neither consumer is enabled; skip the full /proc scan entirely.
+        session.config._startup_pids = None  # type: ignore[attr-defined]
+        return
+    pids = list_workspace_server_pids()
+    session.config._startup_pids = pids  # type: ignore[attr-defined]
+    if debug:
+        print(f"[IPC_TEST_DEBUG] server_bin: {SERVER_BIN}")
+        print(f"[IPC_TEST_DEBUG] server_bin_realpath: {SERVER_BIN_REALPATH}")
+        print(f"[IPC_TEST_DEBUG] detected server pids at session start: {pids}")
+    if pids and abort:
+        pytest.exit(
+            "Aborting pytest: external server instance(s) detected at startup: "
+            f"{pids}. Stop manual server processes before running tests.",
+            returncode=2,
+        )
+
+
+@pytest.fixture(scope="session", autouse=True)
+def ipc_test_run_lock():
+    """Ensure only one IPC pytest invocation runs at a time."""
+    fd = acquire_test_run_lock_nonblocking()
+    try:
+        yield
+    finally:
+        release_test_run_lock(fd)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def server_process(request, ipc_test_run_lock):
+    """Start the server before all tests and shut it down after."""
+    # Skip global fixture for suites that self-manage server lifecycle.
+    if not getattr(request.config, "_needs_session_server", True):
+        yield None
+        return
+
+    ensure_no_external_server_running("server_process startup")
+    # The guard above just proved no server exists; skip the re-scan.
+    cleanup_ipc_files(allow_force=True)
+
+    proc = spawn_server("-t", "2")
+
+    try:
+        # Wait for all IPC objects to appear (server is ready)
+        if not wait_for_ipc_ready(timeout_sec=5.0):
+            proc.kill()
+            raise RuntimeError("Server did not create its IPC objects in time")
+
+        yield proc
+    finally:
+        # Graceful shutdown of fixture-owned process only.
+        _shutdown_server_process(proc)
+        invalidate_server_pids_cache()
+
+        ensure_no_external_server_running("server_process teardown", allowed_pids={proc.pid})
+        # Fixture server is reaped and the teardown guard just ran.
+        cleanup_ipc_files(allow_force=True)
+
+
+# Client environment computed once at import; Popen never mutates env, so
+# sharing one dict across spawns is safe. Per-call tweaks go through
+# env_overrides, which copies only when actually needed.
+_CLIENT_ENV = {**os.environ, "LD_LIBRARY_PATH": BUILD_DIR}
+
+
+def run_client(client_name, inputs, timeout=10, env_overrides=None):
+    """Run a client binary with scripted stdin and return stdout."""
+    client_bin = os.path.join(BUILD_DIR, client_name)
+    env = {**_CLIENT_ENV, **env_overrides} if env_overrides else _CLIENT_ENV
+
+    # close_fds=False and cwd=None keep this spawn on CPython's
+    # posix_spawn fast path (no fork page-table copy of the large pytest
+    # process). Safe here: clients find libipc via RUNPATH/LD_LIBRARY_PATH
+    # and never open cwd-relative files.
+    proc = subprocess.Popen(
+        [client_bin],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        close_fds=False,
+        env=env,
+    )
+
+    # Stay in bytes end-to-end: one joined buffer, no transient str copy.
+    stdin_data = b"\n".join(str(i).encode("ascii") for i in inputs) + b"\n"
+    stdout, stderr = proc.communicate(input=stdin_data, timeout=timeout)
+    return stdout.decode(), stderr.decode(), proc.returncode
+
+
+def run_client_with_delays(client_name, input_groups, timeout=15, env_overrides=None):
+    """Run a client with timed input groups for async testing.
+
+    input_groups is a list of (inputs_list, delay_after_seconds) tuples.
+    """
+    client_bin = os.path.join(BUILD_DIR, client_name)
+    env = {**_CLIENT_ENV, **env_overrides} if env_overrides else _CLIENT_ENV
+
+    # Same posix_spawn-eligible argument set as run_client.
+    proc = subprocess.Popen(
+        [client_bin],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        close_fds=False,
+        env=env,
+    )
+
+    # Write through the raw fd so consecutive zero-delay groups can be
+    # coalesced into one writev syscall; only a non-zero delay is a real
+    # sync point that forces the queued bytes out.
+    # One bytearray is reused across all groups, so no transient bytes
+    # objects are built per group; the memoryview write avoids copying
+    # the buffer back out into bytes.
+    stdin_fd = proc.stdin.fileno()
+    groups = list(input_groups)
+    buf = bytearray()
+    for idx, (inputs, delay) in enumerate(groups):
+        if proc.poll() is not None:
+            break
+        for item in inputs:
+            if isinstance(item, int):
+                buf.extend(b"%d\n" % item)
+            else:
+                buf.extend(str(item).encode("ascii"))
+                buf.append(0x0A)
+        if delay <= 0 and idx + 1 < len(groups):
+            continue
+        try:
+            # The view must be released before buf.clear() may resize it.
+            with memoryview(buf) as view:
+                offset = 0
+                while offset < len(view):
+                    offset += os.write(stdin_fd, view[offset:])
+        except OSError:
+            # Client exited early; collect whatever output is available.
+            break
+        buf.clear()
+        if delay > 0:
+            time.sleep(delay)
+
+    # Python 3.13+ may flush stdin inside communicate(); avoid "flush of closed file"
+    # after we intentionally close stdin for interactive client scripts.
+    if proc.stdin is not None:
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        proc.stdin = None
+    stdout, stderr = proc.communicate(timeout=timeout)
+    return stdout.decode(), stderr.decode(), proc.returncode